@@ -0,0 +1,67 @@
+import copy
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BeamsCache:
+    """Thread-safe bounded LRU cache of the generated beams, optionally persisted to a pickle file.
+
+    The values are copied on get and put, because the beams cleanup of the engine modifies the results in place.
+    """
+
+    def __init__(self, max_size: int, path: Optional[str] = None):
+        self.max_size = max_size
+        self.path = path
+        self.storage = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.path and os.path.exists(self.path):
+            self.load()
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        with self.lock:
+            value = self.storage.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.storage.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def put(self, key: Hashable, value: Dict) -> None:
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.storage[key] = copy.deepcopy(value)
+            self.storage.move_to_end(key)
+            while len(self.storage) > self.max_size:
+                self.storage.popitem(last=False)
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "rb") as fl:
+                storage = pickle.load(fl)
+        except Exception as exc:
+            logger.warning(f"Could not load beams cache from {self.path}: {exc}")
+            return
+        with self.lock:
+            self.storage = OrderedDict(list(storage.items())[-self.max_size :] if self.max_size > 0 else [])
+        logger.info(f"Loaded {len(self.storage)} cached beams from {self.path}")
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self.lock:
+            storage = OrderedDict(self.storage)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as fl:
+            pickle.dump(storage, fl)
+        os.replace(tmp_path, self.path)
+        logger.info(f"Saved {len(storage)} cached beams to {self.path}")
@@ -16,6 +16,15 @@ class AppConfig(BaseSettings):
 
     CUDA_VISIBLE_DEVICES: Union[int, str]
 
+    BATCH_SIZE: int = 32
+    CACHE_SIZE: int = 100000
+    CACHE_PATH: Optional[str] = None
+
+    INFERENCE_MAX_BATCH_SIZE: int = 16
+    INFERENCE_MAX_WAIT_MS: float = 0.0
+    INFERENCE_QUEUE_SIZE: int = 64
+    INFERENCE_WORKERS: int = 1
+
     @validator("PRETRAINED_MODEL")
     def create_full_model_path(cls, pretrained_model_pkl):
         model_file = Path(pretrained_model_pkl).name
@@ -1,9 +1,12 @@
+import copy
 import re
-from typing import Dict, Sequence, Optional
+from typing import Dict, List, Sequence, Optional, Tuple
 
 import src.interactive.functions as interactive
+from src.data.conceptnet import conceptnet_relations
 
 import schemas
+from beams_cache import BeamsCache
 from config import settings
 
 POSTPROCESSING_REGEXP = re.compile(r"[^a-zA-Z0-9\- ]|\bnone\b", re.IGNORECASE)
@@ -75,6 +78,15 @@ class COMeTBaseEngine:
     def annotator(self, *args, **kwargs):
         pass
 
+    def process_requests(self, input_events: List[Dict]) -> List[Dict]:
+        return [self.process_request(input_event) for input_event in input_events]
+
+    def annotator_batch(self, input_events: List[Dict]) -> List[List[Dict]]:
+        return [self.annotator(input_event) for input_event in input_events]
+
+    def save_cache(self):
+        pass
+
 
 class COMeTAtomic(COMeTBaseEngine):
     def __init__(self, model_path, decoding_algorithm):
@@ -105,6 +117,10 @@ class COMeTConceptNet(COMeTBaseEngine):
         self._response_model = schemas.ConceptNetResponseModel
         self._annotator_input_model = schemas.ConceptNetAnnotatorEventModel
         self._annotator_response_model = schemas.ConceptNetAnnotatorResponseModel
+        self._cache = BeamsCache(settings.CACHE_SIZE, settings.CACHE_PATH)
+
+    def save_cache(self):
+        self._cache.save()
 
     def _calc_n_ctx(self):
         return self._data_loader.max_e1 + self._data_loader.max_e2 + self._data_loader.max_r
@@ -112,21 +128,85 @@ class COMeTConceptNet(COMeTBaseEngine):
     def process_request(self, input_event: schemas.ConceptNetInputEventModel) -> Dict:
         return self._get_result(input_event["input"], input_event["category"])
 
-    def _get_result(self, event, category):
-        raw_result = interactive.get_conceptnet_sequence(
-            event, self._model, self._sampler, self._data_loader, self._text_encoder, category
+    def process_requests(self, input_events: List[Dict]) -> List[Dict]:
+        relations = [self._get_relations(input_event["category"]) for input_event in input_events]
+        raw_results = self._get_sequences(
+            [
+                (input_event["input"], relation)
+                for input_event, event_relations in zip(input_events, relations)
+                for relation in event_relations
+            ]
         )
-        return self.all_beams_cleanup(raw_result)
+        results = []
+        for input_event, event_relations in zip(input_events, relations):
+            raw_result = {
+                relation: copy.deepcopy(raw_results[(input_event["input"], relation)]) for relation in event_relations
+            }
+            results.append(self.all_beams_cleanup(raw_result))
+        return results
+
+    def _get_result(self, event, category):
+        return self.process_requests([{"input": event, "category": category}])[0]
+
+    @staticmethod
+    def _get_relations(category) -> List[str]:
+        if isinstance(category, str):
+            category = [category]
+        relations = []
+        for relation in category:
+            if relation == "all":
+                relations.extend(sorted(conceptnet_relations))
+            else:
+                relations.append(relation)
+        return list(dict.fromkeys(relations))
+
+    def _get_sequences(self, e1_relations: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict]:
+        """Returns raw results for (e1, relation) pairs, generates beams in one batch for the pairs not in cache."""
+        results, missing = {}, []
+        for e1, relation in dict.fromkeys(e1_relations):
+            cached_result = self._cache.get((e1, relation, self.decoding_algorithm))
+            if cached_result is None:
+                missing.append((e1, relation))
+            else:
+                results[(e1, relation)] = cached_result
+        if missing:
+            sequences = interactive.get_conceptnet_sequences_batch(
+                missing, self._model, self._sampler, self._data_loader, self._text_encoder, settings.BATCH_SIZE
+            )
+            for (e1, relation), sequence_all in zip(missing, sequences):
+                self._cache.put((e1, relation, self.decoding_algorithm), sequence_all)
+                results[(e1, relation)] = sequence_all
+        return results
 
     def annotator(self, input_event: schemas.ConceptNetAnnotatorEventModel):
-        batch = []
-        for nounphrases in input_event["nounphrases"]:
-            result = {}
-            for nounphrase in nounphrases:
-                conceptnet_result = self._get_result(nounphrase, input_event["category"])
-                result[nounphrase] = self.all_beams_cleanup(conceptnet_result, include_beams_key=False)
-            batch += [result]
-        return batch
+        return self.annotator_batch([input_event])[0]
+
+    def annotator_batch(self, input_events: List[Dict]) -> List[List[Dict]]:
+        """Annotates several requests at once, the beams for all their nounphrases are generated in one batch."""
+        relations = [self._get_relations(input_event["category"]) for input_event in input_events]
+        raw_results = self._get_sequences(
+            [
+                (nounphrase, relation)
+                for input_event, event_relations in zip(input_events, relations)
+                for nounphrases in input_event["nounphrases"]
+                for nounphrase in nounphrases
+                for relation in event_relations
+            ]
+        )
+        batches = []
+        for input_event, event_relations in zip(input_events, relations):
+            batch = []
+            for nounphrases in input_event["nounphrases"]:
+                result = {}
+                for nounphrase in nounphrases:
+                    raw_result = {
+                        relation: copy.deepcopy(raw_results[(nounphrase, relation)]) for relation in event_relations
+                    }
+                    conceptnet_result = self.all_beams_cleanup(raw_result)
+                    result[nounphrase] = self.all_beams_cleanup(conceptnet_result, include_beams_key=False)
+                batch += [result]
+            batches.append(batch)
+        return batches
 
 
 class COMeTFactory:
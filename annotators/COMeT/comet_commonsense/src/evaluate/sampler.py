@@ -327,3 +327,107 @@ class BeamSampler(TopKSampler):
         }
 
         return sampling_result
+
+    def generate_sequence_batch(self, batch, model, data_loader, start_idx, end_len):
+        """Beam search for a batch of examples of the same length at once.
+
+        The beams of all examples are kept in (batch_size, bs) tensors and run through the model as one
+        (batch_size * bs) batch. Every example gets the same beams as with ``generate_sequence``: the beams of the
+        examples which have already ended are only extended with end tokens until all examples end.
+        """
+        bs = self.opt.eval.bs
+        XMB = batch["sequences"][:, :start_idx]
+        MMB = batch["attention_mask"][:, :start_idx]
+        batch_size = XMB.size(0)
+
+        XMB = model_utils.prepare_position_embeddings(self.opt, data_loader.vocab_encoder, XMB.unsqueeze(-1))
+
+        lm_probs = F.log_softmax(model(XMB.unsqueeze(1), sequence_mask=MMB), dim=-1)
+        beam_lls, beam_toks = lm_probs[:, -1, :].topk(bs)
+        beam_losses = [beam_lls]
+
+        ended = (beam_toks == self.end_token).float()
+        counts = 2 - ended
+        beam_seqs = beam_toks.unsqueeze(2).clone()
+        XMB = XMB.repeat_interleave(bs, dim=0)
+        MMB = MMB.repeat_interleave(bs, dim=0)
+        XMB, MMB = self.append_batch(XMB, beam_toks.view(-1), MMB)
+
+        kill_mask = self.kill_mask.to(device=settings.device)
+        example_offsets = torch.arange(batch_size, device=XMB.device).unsqueeze(1) * bs
+
+        for _ in range(end_len):
+            lm_probs = F.log_softmax(model(XMB.unsqueeze(1), sequence_mask=MMB), dim=-1)
+            dist = lm_probs[:, -1, :].view(batch_size, bs, -1)
+
+            # (batch_size, bs, bs) hypotheses, flattened to (batch_size, bs ** 2) in the same order as in
+            # generate_sequence
+            hyp_beam_lls, hyp_beam_toks = dist.topk(bs)
+
+            expanded_ended = ended.unsqueeze(2).repeat(1, 1, bs)
+            hypothesis_mask = expanded_ended * kill_mask + (1 - expanded_ended)
+
+            current_beam_lls = beam_losses[-1].unsqueeze(2).repeat(1, 1, bs).view(batch_size, bs ** 2)
+            hyp_beam_lls = hyp_beam_lls.view(batch_size, bs ** 2) * hypothesis_mask.view(batch_size, -1)
+            hyp_beam_lls = hyp_beam_lls + current_beam_lls
+
+            temp_counts = counts.unsqueeze(2).repeat(1, 1, bs).view(batch_size, bs ** 2)
+
+            beam_lls, top_beam_idxs = (hyp_beam_lls / temp_counts).topk(bs)
+            prev_beam_idxs = top_beam_idxs // bs
+
+            beam_losses = [i.gather(1, prev_beam_idxs) for i in beam_losses]
+            ended = ended.gather(1, prev_beam_idxs)
+            counts = temp_counts.gather(1, top_beam_idxs)
+
+            beam_losses.append(beam_lls * counts)
+
+            ended_mask = (1 - ended).long()
+            end_replacement = (self.end_token * ended).long()
+            next_toks = hyp_beam_toks.view(batch_size, bs ** 2).gather(1, top_beam_idxs)
+            beam_toks = next_toks * ended_mask + end_replacement
+
+            ended = ended + (beam_toks == self.end_token).float() * (1 - ended)
+            counts = counts + (1 - ended)
+
+            beam_seqs = beam_seqs.gather(1, prev_beam_idxs.unsqueeze(2).expand(-1, -1, beam_seqs.size(2)))
+            beam_seqs = torch.cat((beam_seqs, beam_toks.unsqueeze(2)), dim=2)
+
+            # all beams of an example share the attention mask, so only the sequences are reordered
+            XMB = XMB.index_select(0, (prev_beam_idxs + example_offsets).view(-1))
+
+            XMB, MMB = self.append_batch(XMB, beam_toks.view(-1), MMB)
+
+            if (beam_toks == self.end_token).sum().item() == batch_size * bs:
+                break
+
+        sampling_results = []
+
+        for example_beam_seqs, example_beam_lls, example_counts in zip(beam_seqs, beam_lls, counts):
+            beams = []
+
+            for beam in example_beam_seqs:
+                beams.append(
+                    " ".join(
+                        "".join(
+                            [
+                                data_loader.vocab_decoder[tok.item()].replace("</w>", " ").replace("\n", "")
+                                for tok in beam
+                                if tok != self.end_token
+                            ]
+                        ).split()
+                    )
+                )
+
+            sampling_results.append(
+                {
+                    "sequence": beams[0],
+                    "beams": beams,
+                    "beam_losses": example_beam_lls.tolist(),
+                    "loss": example_beam_lls[0].item(),
+                    "beam_lengths": example_counts.tolist(),
+                    "length": example_counts[0].item(),
+                }
+            )
+
+        return sampling_results
@@ -176,6 +176,52 @@ def get_conceptnet_sequence(e1, model, sampler, data_loader, text_encoder, relat
         return {relation: sequence_all}
 
 
+def get_conceptnet_sequences_batch(e1_relations, model, sampler, data_loader, text_encoder, batch_size=32):
+    """Generates beams for every (e1, relation) pair, returns the list of sequence_all dicts in the same order.
+
+    The pairs are decoded in padded batches of ``batch_size`` with the sampler which supports batches
+    (the beam sampler), and one by one otherwise.
+    """
+    outputs = []
+    inputs = []
+
+    with torch.no_grad():
+        for e1, relation in e1_relations:
+            outputs.append({"e1": e1, "relation": relation})
+
+            if data_loader.max_r != 1:
+                relation_sequence = data.conceptnet_data.split_into_words[relation]
+            else:
+                relation_sequence = "<{}>".format(relation)
+
+            batch, abort = set_conceptnet_inputs(
+                e1, relation_sequence, text_encoder, data_loader.max_e1, data_loader.max_r, False
+            )
+
+            if not abort:
+                inputs.append((outputs[-1], batch))
+
+        start_idx = data_loader.max_e1 + data_loader.max_r
+        if hasattr(sampler, "generate_sequence_batch"):
+            for i in range(0, len(inputs), batch_size):
+                chunk = inputs[i : i + batch_size]
+                batch = {
+                    "sequences": torch.cat([example_batch["sequences"] for _, example_batch in chunk]),
+                    "attention_mask": torch.cat([example_batch["attention_mask"] for _, example_batch in chunk]),
+                }
+                sampling_results = sampler.generate_sequence_batch(
+                    batch, model, data_loader, start_idx, data_loader.max_e2
+                )
+                for (sequence_all, _), sampling_result in zip(chunk, sampling_results):
+                    sequence_all["beams"] = sampling_result["beams"]
+        else:
+            for sequence_all, batch in inputs:
+                sampling_result = sampler.generate_sequence(batch, model, data_loader, start_idx, data_loader.max_e2)
+                sequence_all["beams"] = sampling_result["beams"]
+
+    return outputs
+
+
 def set_conceptnet_inputs(input_event, relation, text_encoder, max_e1, max_r, force):
     abort = False
 
@@ -1,8 +1,9 @@
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 import uvicorn
 
 import sentry_sdk
@@ -11,6 +12,7 @@ from sentry_sdk.integrations.logging import ignore_logger
 
 from comet_commonsense.interface import COMeTFactory
 from comet_commonsense.config import settings
+from common.inference_executor import BatchingInferenceExecutor, InferenceQueueFullError
 import test_server
 
 ignore_logger("root")
@@ -48,27 +50,73 @@ def handler(data):
 
 
 @timing
-def annotator_handler(data):
+def batch_handler(input_events):
     try:
-        return comet_engine.annotator(data)
+        return comet_engine.process_requests(input_events)
     except Exception as exc:
         sentry_sdk.capture_exception(exc)
         logger.exception(exc)
         raise exc
 
 
+@timing
+def annotator_batch_handler(input_events):
+    try:
+        return comet_engine.annotator_batch(input_events)
+    except Exception as exc:
+        sentry_sdk.capture_exception(exc)
+        logger.exception(exc)
+        raise exc
+
+
+# the model runs in a worker thread, so that the event loop keeps accepting requests,
+# the requests which arrive during inference are merged into the next batch;
+# both endpoints share the threads, so that at most INFERENCE_WORKERS batches run on the model at once
+inference_pool = ThreadPoolExecutor(max_workers=settings.INFERENCE_WORKERS)
+executors = {
+    name: BatchingInferenceExecutor(
+        batch_fn,
+        max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+        max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+        max_queue_size=settings.INFERENCE_QUEUE_SIZE,
+        num_workers=settings.INFERENCE_WORKERS,
+        thread_pool=inference_pool,
+    )
+    for name, batch_fn in [("comet", batch_handler), ("comet_annotator", annotator_batch_handler)]
+}
+
+
+async def run_inference(name, input_event):
+    try:
+        results = await executors[name].submit([input_event])
+    except InferenceQueueFullError as exc:
+        logger.warning(f"{settings.SERVICE_NAME} is overloaded: {exc}")
+        raise HTTPException(status_code=503, detail=str(exc))
+    return results[0]
+
+
 @app.post("/comet", response_model=comet_engine.response_model)
 async def comet_base_handler(input_event: comet_engine.input_event_model):
-    result = handler(input_event.dict())
+    result = await run_inference("comet", input_event.dict())
     return result
 
 
 @app.post("/comet_annotator", response_model=comet_engine.annotator_response_model)
 async def comet_annotator_handler(input_event: comet_engine.annotator_input_model):
-    result = annotator_handler(input_event.dict())
+    result = await run_inference("comet_annotator", input_event.dict())
     return result
 
 
+@app.get("/metrics")
+async def metrics():
+    return {name: executor.metrics() for name, executor in executors.items()}
+
+
+@app.on_event("shutdown")
+def save_cache():
+    comet_engine.save_cache()
+
+
 app = SentryAsgiMiddleware(app)
 
 try:
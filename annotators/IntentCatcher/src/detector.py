@@ -4,15 +4,16 @@ import os
 from itertools import chain
 
 import json
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
 
 import re
+import sre_parse
 import numpy as np
 
 import tensorflow as tf
 import tensorflow_hub as hub
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 USE_MODEL_PATH = os.environ.get("USE_MODEL_PATH", None)
 if USE_MODEL_PATH is None:
@@ -36,14 +37,157 @@ if TFHUB_CACHE_DIR is None:
 
 os.environ["TF_XLA_FLAGS"] = "--tf_xla_cpu_global_jit"  # Don't know that is
 
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 10000))
+
+
+class IntentsMatcher:
+    """
+    Finds all intents with any pattern fully matching a text, as re.fullmatch of every pattern does.
+    Patterns without special characters are looked up in a dict of strings. Other patterns are
+    dispatched by the first character of the text, so that only the patterns which can start
+    with this character are matched.
+
+    """
+
+    def __init__(self, intent_patterns: Dict[str, List[str]]):
+        self.literals = defaultdict(set)
+        self.patterns_by_first_char = defaultdict(list)
+        self.patterns_for_any_char = []
+        for intent, patterns in intent_patterns.items():
+            for pattern in patterns:
+                parsed_pattern = sre_parse.parse(pattern)
+                if all(op == sre_parse.LITERAL for op, _ in parsed_pattern):
+                    self.literals["".join(chr(code) for _, code in parsed_pattern)].add(intent)
+                    continue
+                first_chars, nullable = self._first_chars(parsed_pattern)
+                if first_chars is None or nullable:
+                    self.patterns_for_any_char.append((intent, re.compile(pattern)))
+                else:
+                    for char in first_chars:
+                        self.patterns_by_first_char[char].append((intent, re.compile(pattern)))
+
+    @classmethod
+    def _first_chars(cls, parsed_pattern) -> Tuple[Optional[Set[str]], bool]:
+        """Returns the characters a match can start with (None if any) and whether the match can be empty."""
+        first_chars = set()
+        for op, av in parsed_pattern:
+            if op == sre_parse.LITERAL:
+                return first_chars | {chr(av)}, False
+            elif op == sre_parse.AT:
+                continue
+            elif op == sre_parse.IN:
+                for set_op, set_av in av:
+                    if set_op == sre_parse.LITERAL:
+                        first_chars.add(chr(set_av))
+                    elif set_op == sre_parse.RANGE and set_av[1] - set_av[0] < 256:
+                        first_chars.update(chr(code) for code in range(set_av[0], set_av[1] + 1))
+                    else:
+                        return None, True
+                return first_chars, False
+            elif op == sre_parse.BRANCH:
+                nullable = False
+                for branch in av[1]:
+                    branch_chars, branch_nullable = cls._first_chars(branch)
+                    if branch_chars is None:
+                        return None, True
+                    first_chars |= branch_chars
+                    nullable = nullable or branch_nullable
+            elif op == sre_parse.SUBPATTERN and not av[1] and not av[2]:
+                subpattern_chars, nullable = cls._first_chars(av[3])
+                if subpattern_chars is None:
+                    return None, True
+                first_chars |= subpattern_chars
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+                subpattern_chars, nullable = cls._first_chars(av[2])
+                if subpattern_chars is None:
+                    return None, True
+                first_chars |= subpattern_chars
+                nullable = nullable or av[0] == 0
+            else:
+                return None, True
+            if not nullable:
+                return first_chars, False
+        return first_chars, True
+
+    def __call__(self, text: str) -> Set[str]:
+        intents = set(self.literals.get(text, set()))
+        candidates = self.patterns_by_first_char.get(text[:1], []) + self.patterns_for_any_char
+        for intent, pattern in candidates:
+            if intent not in intents and pattern.fullmatch(text):
+                intents.add(intent)
+        return intents
+
+
+class EmbeddingCache:
+    """
+    LRU cache of sentence embeddings keyed by the exact sentence text.
+
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.storage = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sentence: str) -> Optional[np.ndarray]:
+        embedding = self.storage.get(sentence)
+        if embedding is None:
+            self.misses += 1
+        else:
+            self.storage.move_to_end(sentence)
+            self.hits += 1
+        return embedding
+
+    def put(self, sentence: str, embedding: np.ndarray):
+        if self.max_size <= 0:
+            return
+        self.storage[sentence] = embedding
+        self.storage.move_to_end(sentence)
+        while len(self.storage) > self.max_size:
+            self.storage.popitem(last=False)
+
+    def stats(self) -> Dict:
+        requests_num = self.hits + self.misses
+        return {
+            "size": len(self.storage),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests_num if requests_num else 0.0,
+        }
+
 
 class AbstractDetector:
     def __init__(self, logger):
         self.logger = logger
+        self.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_SIZE)
 
     def detect(self, utterances: List, sess):
         raise NotImplementedError("Detect method not implemented!")
 
+    def embed(self, sentences: List[str], sess) -> np.ndarray:
+        """
+        Embeds the sentences with USE, the sentences which are not in cache are deduplicated
+        and embedded in one run.
+
+        """
+        if not sentences:
+            return sess.run(self.embedded_sentences, feed_dict={self.sentences: sentences})
+        embeddings = {sentence: self.embedding_cache.get(sentence) for sentence in sentences}
+        new_sentences = [sentence for sentence, embedding in embeddings.items() if embedding is None]
+        if new_sentences:
+            new_embeddings = sess.run(self.embedded_sentences, feed_dict={self.sentences: new_sentences})
+            for sentence, embedding in zip(new_sentences, new_embeddings):
+                # copy not to keep the whole batch array in cache
+                embeddings[sentence] = embedding.copy()
+                self.embedding_cache.put(sentence, embeddings[sentence])
+        self.logger.info(
+            f"Embedded {len(new_sentences)} new of {len(sentences)} sentences, "
+            f"cache hit rate: {self.embedding_cache.stats()['hit_rate']:.3f}"
+        )
+        return np.stack([embeddings[sentence] for sentence in sentences])
+
 
 class ClassifierDetector(AbstractDetector):
     """
@@ -67,7 +211,7 @@ class ClassifierDetector(AbstractDetector):
         self.logger.info(f"All utterances: {utterances}")
         len_sentences = [len(utt) for utt in utterances]
         tok_sentences = list(chain.from_iterable(utterances))
-        embedded_sentences = sess.run(self.embedded_sentences, feed_dict={self.sentences: tok_sentences})
+        embedded_sentences = self.embed(tok_sentences, sess)
 
         predictions = self.model.predict(embedded_sentences)
         predictions_class = np.argmax(predictions, axis=1)
@@ -128,7 +272,7 @@ class MultilabelDetector(AbstractDetector):
             return [
                 {intent: {"detected": 0, "confidence": 0.0} for intent in self.intents} for i in range(len(utterances))
             ]
-        embedded_sentences = sess.run(self.embedded_sentences, feed_dict={self.sentences: tok_sentences})
+        embedded_sentences = self.embed(tok_sentences, sess)
 
         predictions = self.model.predict(embedded_sentences)
 
@@ -207,7 +351,7 @@ class RegMD(MultilabelDetector):
             + [rf"^{pattern}[\.\?!]?$" for pattern in data.get("reg_phrases", [])]
             for intent, data in json.load(open(INTENT_PHRASES_PATH))["intent_phrases"].items()
         }
-        self.regexp = {intent: [re.compile(phrase) for phrase in phrases] for intent, phrases in self.regexp.items()}
+        self.regexp = IntentsMatcher(self.regexp)
 
     def unite_responses(self, responses_a, responses_b):
         assert len(responses_a) == len(responses_b), self.logger.error("Responses have unequal lengths!")
@@ -228,14 +372,11 @@ class RegMD(MultilabelDetector):
         for utterance in utterances:
             resp = {intent: {"detected": 0, "confidence": 0.0} for intent in self.intents}
             not_detected_utterance = utterance.copy()
-            for intent, regs in self.regexp.items():
-                for i, utt in enumerate(utterance):
-                    for reg in regs:
-                        if reg.fullmatch(utt):
-                            resp[intent]["detected"] = 1
-                            resp[intent]["confidence"] = 1.0
-                            not_detected_utterance[i] = None
-                            break
+            for i, utt in enumerate(utterance):
+                for intent in self.regexp(utt):
+                    resp[intent]["detected"] = 1
+                    resp[intent]["confidence"] = 1.0
+                    not_detected_utterance[i] = None
             not_detected_utterance = [utt for utt in not_detected_utterance if utt]
             not_detected_utterances.append(not_detected_utterance)
             responds.append(resp)
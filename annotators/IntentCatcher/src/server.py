@@ -43,6 +43,11 @@ def detect():
     return jsonify(results)
 
 
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify(detector.embedding_cache.stats())
+
+
 if __name__ == "__main__":
     app.run(debug=False, host="0.0.0.0", port=8014)
     sess.close()
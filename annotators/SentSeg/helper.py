@@ -1,6 +1,8 @@
 import pickle
 import re
 
+import numpy as np
+
 
 def load_dictionaries(pickle_file):
     dicts = pickle.load(open(pickle_file, mode="rb"))
@@ -76,3 +78,38 @@ def get_chunks(seq, tags):
         chunks.append(chunk)
 
     return chunks
+
+
+def viterbi_decode_batch(logits, sequence_lengths, transition_params):
+    """
+    Decodes the highest scoring sequences of tags for a padded batch,
+    gives the same results as tf.contrib.crf.viterbi_decode for every sequence.
+    Args:
+            logits: [batch_size, max_seq_len, num_tags] unary potentials
+            sequence_lengths: [batch_size] real lengths of sequences
+            transition_params: [num_tags, num_tags] binary potentials
+    Returns:
+            list of lists of tag ids of real lengths
+    """
+    logits = np.asarray(logits)
+    sequence_lengths = np.asarray(sequence_lengths)
+    batch_size, max_seq_len, num_tags = logits.shape
+    batch_indices = np.arange(batch_size)
+
+    trellis = logits[:, 0]
+    backpointers = np.zeros((batch_size, max_seq_len, num_tags), dtype=np.int32)
+    for t in range(1, max_seq_len):
+        # v[b, i, j] is the score of tag i at t - 1 followed by tag j at t
+        v = np.expand_dims(trellis, 2) + transition_params
+        active = np.expand_dims(t < sequence_lengths, 1)
+        trellis = np.where(active, logits[:, t] + np.max(v, 1), trellis)
+        backpointers[:, t] = np.argmax(v, 1)
+
+    tags = np.zeros((batch_size, max_seq_len), dtype=np.int32)
+    current_tags = np.argmax(trellis, 1)
+    tags[batch_indices, sequence_lengths - 1] = current_tags
+    for t in range(max_seq_len - 1, 0, -1):
+        active = t < sequence_lengths
+        current_tags = np.where(active, backpointers[batch_indices, t, current_tags], current_tags)
+        tags[:, t - 1] = np.where(active, current_tags, tags[:, t - 1])
+    return [tags[i, :length].tolist() for i, length in enumerate(sequence_lengths)]
@@ -451,16 +451,57 @@ class model:
             pred_labels = [self.id2tag[t] for t in viterbi_sequences[0]]
             # print("Pred_labels: ",pred_labels)
 
-            tag2text = {"B-S": ".", "B-Q": "?", "O": "."}
+            return self.punctuate(words, pred_labels)
+
+    def predict_batch(self, sess, texts):
+        """Punctuates a list of texts, gives the same results as predict for every text.
+
+        The char CNN features of a word depend on the padding of words to the longest word in the batch,
+        so the sentences are grouped by the length of their longest word, and every group is padded and run
+        through the model at once. CRF paths of the whole group are decoded by the batched Viterbi in numpy.
+        """
+        results = list(texts)
+        groups = {}
+        for i, text in enumerate(texts):
+            if text == "" or any(p in text for p in [".", "?", "!"]):
+                continue
+            words = word_tokenize(text)
+            groups.setdefault(max(len(word) for word in words), []).append((i, words))
+
+        for group in groups.values():
+            indexed_data = self.index_data({"word": [words for _, words in group]})
+            current_idx = 0
+            while current_idx < len(indexed_data["indexed_word"]):
+                start_idx = current_idx
+                batch, current_idx = self.get_batch(indexed_data, current_idx)
+                feed_dict = {
+                    self.tf_word_ids: batch["padded_word"],
+                    self.tf_sentence_lengths: batch["real_sentence_lengths"],
+                    self.tf_dropout: 1.0,
+                    self.tf_char_ids: batch["padded_char"],
+                    self.tf_word_lengths: batch["lengths_of_word"],
+                    self.tf_raw_word: batch["padded_raw_word"],
+                }
+                _logits, _transition_params = sess.run([self.logits, self.transition_params], feed_dict=feed_dict)
+                viterbi_sequences = helper.viterbi_decode_batch(
+                    _logits, batch["real_sentence_lengths"], _transition_params
+                )
+                for (i, words), viterbi_sequence in zip(group[start_idx:current_idx], viterbi_sequences):
+                    results[i] = self.punctuate(words, [self.id2tag[t] for t in viterbi_sequence])
+        return results
+
+    @staticmethod
+    def punctuate(words, pred_labels):
+        tag2text = {"B-S": ".", "B-Q": "?", "O": "."}
 
-            punctuation = tag2text[pred_labels[0]]
-            sent = words[0]
+        punctuation = tag2text[pred_labels[0]]
+        sent = words[0]
 
-            for word, tag in zip(words[1:], pred_labels[1:]):
-                if tag != "O":
-                    sent += punctuation
-                    punctuation = tag2text[tag]
-                sent += " " + word
-            sent += punctuation
+        for word, tag in zip(words[1:], pred_labels[1:]):
+            if tag != "O":
+                sent += punctuation
+                punctuation = tag2text[tag]
+            sent += " " + word
+        sent += punctuation
 
-            return sent
+        return sent
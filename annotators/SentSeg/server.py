@@ -46,10 +46,12 @@ def respond():
         if len(user_sent_without_alexa) > 1:
             user_sentences[-1] = user_sent_without_alexa
 
+    texts = [text for text in user_sentences if text.strip()]
+    sentsegs = iter(model.predict_batch(sess, texts))
     for i, text in enumerate(user_sentences):
         if text.strip():
             logger.info(f"user text: {text}, session_id: {session_id}")
-            sentseg = model.predict(sess, text)
+            sentseg = next(sentsegs)
             sentseg = sentseg.replace(" '", "'")
             sentseg = preprocessing(sentseg)
             segments = split_segments(sentseg)
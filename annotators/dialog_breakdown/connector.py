@@ -2,10 +2,10 @@
 import time
 import asyncio
 import logging
-import requests
+import aiohttp
 import sentry_sdk
 
-from typing import Callable, Dict
+from typing import Callable, Dict, List, Optional
 from os import getenv
 
 
@@ -17,20 +17,63 @@ headers = {"Content-Type": "application/json;charset=utf-8"}
 
 
 class BatchConnector:
-    def __init__(self, url: str):
+    """Sends tasks to the service with a pooled aiohttp session.
+
+    Tasks which arrive at the same iteration of the event loop (concurrent dialogs) are coalesced
+    into one batched POST request, and the service response is split back between the tasks.
+    """
+
+    _session: Optional[aiohttp.ClientSession] = None
+
+    def __init__(self, url: str, timeout: float = 1.0, max_batch_size: int = 64, connections_limit: int = 16):
         self._url = url
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._max_batch_size = max_batch_size
+        self._connections_limit = connections_limit
+        self._pending_tasks = []
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if BatchConnector._session is None or BatchConnector._session.closed:
+            BatchConnector._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self._connections_limit, keepalive_timeout=60),
+                headers=headers,
+            )
+        return BatchConnector._session
 
     async def send(self, payload: Dict, callback: Callable):
+        self._pending_tasks.append((payload, callback))
+        if len(self._pending_tasks) > 1:
+            # the task will be sent together with the first pending one
+            return
+        # let the other concurrent dialogs put their tasks to the batch
+        await asyncio.sleep(0)
+        pending_tasks, self._pending_tasks = self._pending_tasks, []
+        for i in range(0, len(pending_tasks), self._max_batch_size):
+            asyncio.create_task(self._send_batch(pending_tasks[i : i + self._max_batch_size]))
+
+    async def _send_batch(self, tasks: List):
         try:
             st_time = time.time()
-            result = requests.request(
-                url=self._url, headers=headers, json=payload["payload"], method="POST", timeout=1.0
-            ).json()
+            batch_payload = {}
+            tasks_sizes = []
+            for payload, _ in tasks:
+                for key, value in payload["payload"].items():
+                    batch_payload.setdefault(key, []).extend(value)
+                tasks_sizes.append(len(next(iter(payload["payload"].values()), [])))
+            async with self._get_session().post(self._url, json=batch_payload, timeout=self._timeout) as resp:
+                resp.raise_for_status()
+                result = await resp.json()
             result = [res[0] for res in result]
             total_time = time.time() - st_time
-            logger.info(f"dialog-breakdown batch connector exec time: {total_time:.3f}s")
-            asyncio.create_task(callback(task_id=payload["task_id"], response={"batch": result}))
+            logger.info(f"dialog-breakdown batch connector exec time: {total_time:.3f}s for {len(tasks)} tasks")
+            start = 0
+            for (payload, callback), task_size in zip(tasks, tasks_sizes):
+                asyncio.create_task(
+                    callback(task_id=payload["task_id"], response={"batch": result[start : start + task_size]})
+                )
+                start += task_size
         except Exception as e:
             logger.exception(e)
             sentry_sdk.capture_exception(e)
-            asyncio.create_task(callback(task_id=payload["task_id"], response=e))
+            for payload, callback in tasks:
+                asyncio.create_task(callback(task_id=payload["task_id"], response=e))
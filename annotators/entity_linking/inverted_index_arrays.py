@@ -0,0 +1,173 @@
+# Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Array-backed storage of the entity linking inverted index.
+
+The pickled dicts of lists of tuples are replaced with numpy arrays opened with mmap_mode, so that several
+entity linking replicas on a host share the page cache instead of holding their own copies of the index:
+
+* token -> postings in CSR layout: ``postings_offsets.npy`` (row boundaries for every token),
+  ``postings_entities.npy`` (entity numbers, sorted and unique in every row) and ``postings_freqs.npy``
+  (entity popularities);
+* string tables (tokens sorted for binary search, entity ids, entity names) as utf-8 blobs
+  ``{name}_blob.bin`` indexed by ``{name}_offsets.npy``;
+* ``q2name_offsets.npy`` with the boundaries of the names of every entity in the names table.
+
+Run the module as a script to convert the existing pickles.
+"""
+
+import argparse
+import bisect
+import pickle
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+
+
+class StringTable:
+    def __init__(self, path: Union[str, Path], name: str) -> None:
+        path = Path(path)
+        self.offsets = np.load(str(path / f"{name}_offsets.npy"), mmap_mode="r")
+        if self.offsets[-1] > 0:
+            self.blob = np.memmap(str(path / f"{name}_blob.bin"), dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+
+    @staticmethod
+    def save(strings: List[str], path: Union[str, Path], name: str) -> None:
+        path = Path(path)
+        encoded_strings = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded_strings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(encoded_string) for encoded_string in encoded_strings])
+        np.save(str(path / f"{name}_offsets.npy"), offsets)
+        with open(path / f"{name}_blob.bin", "wb") as fl:
+            for encoded_string in encoded_strings:
+                fl.write(encoded_string)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i] : self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+
+class Q2NameTable:
+    """Maps entity number to the list of the entity title and aliases."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.names = StringTable(path, "names")
+        self.q2name_offsets = np.load(str(Path(path) / "q2name_offsets.npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.q2name_offsets) - 1
+
+    def __getitem__(self, entity_num: int) -> List[str]:
+        return [self.names[i] for i in range(self.q2name_offsets[entity_num], self.q2name_offsets[entity_num + 1])]
+
+
+class ArrayInvertedIndex:
+    """Maps token to the postings (entity number, entity popularity) of the entities with this token in labels."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        path = Path(path)
+        self.tokens = StringTable(path, "tokens")
+        self.postings_offsets = np.load(str(path / "postings_offsets.npy"), mmap_mode="r")
+        self.postings_entities = np.load(str(path / "postings_entities.npy"), mmap_mode="r")
+        self.postings_freqs = np.load(str(path / "postings_freqs.npy"), mmap_mode="r")
+
+    def token_num(self, token: str) -> int:
+        """Returns the row of the token in the postings or -1 if the token is not in the index."""
+        num = bisect.bisect_left(self.tokens, token)
+        if num < len(self.tokens) and self.tokens[num] == token:
+            return num
+        return -1
+
+    def postings(self, token: str) -> Tuple[np.ndarray, np.ndarray]:
+        num = self.token_num(token)
+        if num < 0:
+            return self.postings_entities[:0], self.postings_freqs[:0]
+        start, end = self.postings_offsets[num], self.postings_offsets[num + 1]
+        return self.postings_entities[start:end], self.postings_freqs[start:end]
+
+    def __contains__(self, token: str) -> bool:
+        return self.token_num(token) >= 0
+
+    def __getitem__(self, token: str) -> List[Tuple[int, int]]:
+        if token not in self:
+            raise KeyError(token)
+        entities, freqs = self.postings(token)
+        return list(zip(entities.tolist(), freqs.tolist()))
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def keys(self) -> Iterator[str]:
+        return iter(self.tokens)
+
+
+def convert_inverted_index(
+    inverted_index: Dict[str, List[Tuple[int, int]]],
+    entities_list: List[str],
+    q2name: List[List[str]],
+    save_path: Union[str, Path],
+) -> None:
+    save_path = Path(save_path)
+    save_path.mkdir(parents=True, exist_ok=True)
+
+    tokens = sorted(inverted_index)
+    postings_offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    postings_entities, postings_freqs = [], []
+    for n, token in enumerate(tokens):
+        # one posting per entity sorted by entity number, so that the slices of the arrays need no deduplication
+        postings = []
+        for entity_num, freq in sorted(set(inverted_index[token])):
+            if not postings or postings[-1][0] != entity_num:
+                postings.append((entity_num, freq))
+        postings_entities.extend(entity_num for entity_num, _ in postings)
+        postings_freqs.extend(freq for _, freq in postings)
+        postings_offsets[n + 1] = postings_offsets[n] + len(postings)
+    StringTable.save(tokens, save_path, "tokens")
+    np.save(str(save_path / "postings_offsets.npy"), postings_offsets)
+    np.save(str(save_path / "postings_entities.npy"), np.array(postings_entities, dtype=np.int32))
+    np.save(str(save_path / "postings_freqs.npy"), np.array(postings_freqs, dtype=np.int64))
+
+    StringTable.save(entities_list, save_path, "entities")
+
+    q2name_offsets = np.zeros(len(q2name) + 1, dtype=np.int64)
+    q2name_offsets[1:] = np.cumsum([len(names) for names in q2name])
+    StringTable.save([name for names in q2name for name in names], save_path, "names")
+    np.save(str(save_path / "q2name_offsets.npy"), q2name_offsets)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--load_path", type=Path, default=Path("~/.deeppavlov/downloads/wikidata_eng").expanduser())
+    parser.add_argument("--inverted_index_filename", type=str, default="inverted_index_eng.pickle")
+    parser.add_argument("--entities_list_filename", type=str, default="entities_list.pickle")
+    parser.add_argument("--q2name_filename", type=str, default="wiki_eng_q_to_name.pickle")
+    parser.add_argument("--save_path", type=Path, default=None, help="default is inverted_index_arrays in load_path")
+    args = parser.parse_args()
+
+    with open(args.load_path / args.inverted_index_filename, "rb") as fl:
+        inverted_index = pickle.load(fl)
+    with open(args.load_path / args.entities_list_filename, "rb") as fl:
+        entities_list = pickle.load(fl)
+    with open(args.load_path / args.q2name_filename, "rb") as fl:
+        q2name = pickle.load(fl)
+    save_path = args.save_path or args.load_path / "inverted_index_arrays"
+    convert_inverted_index(inverted_index, entities_list, q2name, save_path)
@@ -17,11 +17,13 @@ import re
 import sqlite3
 import logging
 from typing import List, Dict, Tuple, Optional, Any
-from collections import defaultdict, Counter
+from collections import defaultdict
+from functools import lru_cache
 
 import en_core_web_sm
 import inflect
 import nltk
+import numpy as np
 import pymorphy2
 import sentry_sdk
 from nltk.corpus import stopwords
@@ -36,6 +38,8 @@ from deeppavlov.core.common.file import load_pickle, save_pickle
 from deeppavlov.models.spelling_correction.levenshtein.levenshtein_searcher import LevenshteinSearcher
 from deeppavlov.models.kbqa.rel_ranking_infer import RelRankerInfer
 
+from inverted_index_arrays import ArrayInvertedIndex, Q2NameTable, StringTable
+
 sentry_sdk.init(os.getenv("SENTRY_DSN"))
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.DEBUG)
 log = logging.getLogger(__name__)
@@ -80,6 +84,8 @@ class KBEntityLinker(Component, Serializable):
         num_entities_for_bert_ranking: int = 100,
         lemmatize: bool = False,
         use_prefix_tree: bool = False,
+        index_format: str = "pickle",
+        index_arrays_dirname: str = "inverted_index_arrays",
         **kwargs,
     ) -> None:
         """
@@ -112,12 +118,19 @@ class KBEntityLinker(Component, Serializable):
             num_entities_to_return: how many entities for each substring the system returns
             lemmatize: whether to lemmatize tokens of extracted entity
             use_prefix_tree: whether to use prefix tree for search of entities with typos in entity labels
+            index_format: "pickle" to load inverted index, entities list and names from the pickle files or "arrays"
+                to memory-map the arrays made from them by inverted_index_arrays.py
+            index_arrays_dirname: folder in load_path with the inverted index arrays
             **kwargs:
         """
         super().__init__(save_path=save_path, load_path=load_path)
         self.morph = pymorphy2.MorphAnalyzer()
         self.lemmatize = lemmatize
         self.use_prefix_tree = use_prefix_tree
+        if index_format not in {"pickle", "arrays"}:
+            raise ValueError(f"unsupported index_format value {index_format}")
+        self.index_format = index_format
+        self.index_arrays_dirname = index_arrays_dirname
         self.inverted_index_filename = inverted_index_filename
         self.entities_list_filename = entities_list_filename
         self.build_inverted_index = build_inverted_index
@@ -165,6 +178,9 @@ class KBEntityLinker(Component, Serializable):
         }
         if self.use_descriptions and self.entity_ranker is None:
             raise ValueError("No entity ranker is provided!")
+        # lemmatization and search of the index keys are deterministic and the same mentions recur in dialogs
+        self.lemmatize_substr = lru_cache(maxsize=10000)(self.lemmatize_substr)
+        self.find_index_tokens = lru_cache(maxsize=100000)(self.find_index_tokens)
 
         if self.use_prefix_tree:
             alphabet = (
@@ -200,9 +216,15 @@ class KBEntityLinker(Component, Serializable):
         self.nouns_dict = {noun: freq for noun, freq in nouns_with_freq}
 
     def load(self) -> None:
-        self.inverted_index = load_pickle(self.load_path / self.inverted_index_filename)
-        self.entities_list = load_pickle(self.load_path / self.entities_list_filename)
-        self.q2name = load_pickle(self.load_path / self.q2name_filename)
+        if self.index_format == "arrays":
+            index_arrays_path = self.load_path / self.index_arrays_dirname
+            self.inverted_index = ArrayInvertedIndex(index_arrays_path)
+            self.entities_list = StringTable(index_arrays_path, "entities")
+            self.q2name = Q2NameTable(index_arrays_path)
+        else:
+            self.inverted_index = load_pickle(self.load_path / self.inverted_index_filename)
+            self.entities_list = load_pickle(self.load_path / self.entities_list_filename)
+            self.q2name = load_pickle(self.load_path / self.q2name_filename)
         if self.who_entities_filename:
             self.who_entities = load_pickle(self.load_path / self.who_entities_filename)
         if self.freq_dict_filename:
@@ -236,6 +258,16 @@ class KBEntityLinker(Component, Serializable):
             short_context_batch = ["" for _ in entity_substr_batch]
         if entity_types_batch is None:
             entity_types_batch = [[[] for _ in entity_substr_list] for entity_substr_list in entity_substr_batch]
+        lemm_entities_batch = [
+            [self.lemmatize_entity(entity_substr, short_context) for entity_substr in entity_substr_list]
+            for entity_substr_list, short_context in zip(entity_substr_batch, short_context_batch)
+        ]
+        # candidate entities for all mentions of the batch are found together
+        candidate_entities_batch = iter(
+            self.candidate_entities_inverted_index_batch(
+                [lemm_entity for lemm_entities in lemm_entities_batch for lemm_entity, _ in lemm_entities]
+            )
+        )
         for entity_substr_list, template_found, long_context, entity_types_list, short_context in zip(
             entity_substr_batch, templates_batch, long_context_batch, entity_types_batch, short_context_batch
         ):
@@ -244,7 +276,12 @@ class KBEntityLinker(Component, Serializable):
             tokens_match_conf_list = []
             for entity_substr, entity_types in zip(entity_substr_list, entity_types_list):
                 entity_ids, confidences, tokens_match_conf = self.link_entity(
-                    entity_substr, long_context, short_context, template_found, entity_types
+                    entity_substr,
+                    long_context,
+                    short_context,
+                    template_found,
+                    entity_types,
+                    candidate_entities=next(candidate_entities_batch),
                 )
                 if self.num_entities_to_return == 1:
                     if entity_ids:
@@ -278,6 +315,24 @@ class KBEntityLinker(Component, Serializable):
             lemm_text = " ".join(processed_tokens)
         return lemm_text
 
+    def lemmatize_entity(self, entity: str, short_context: Optional[str] = None) -> Tuple[str, bool]:
+        """Lemmatize the entity if it is the whole utterance or follows "let's talk about"-like phrases.
+
+        Returns:
+            the lemmatized entity and whether the entity is the utterance
+        """
+        if not entity:
+            return entity, False
+        lets_talk_phrases = ["let's talk", "let's chat", "what about", "do you know", "tell me about"]
+        found_lets_talk_phrase = short_context and any([phrase in short_context for phrase in lets_talk_phrases])
+        if (
+            short_context
+            and (entity == short_context or entity == short_context[:-1] or found_lets_talk_phrase)
+            and len(entity.split()) == 1
+        ):
+            return self.lemmatize_substr(entity), True
+        return entity, False
+
     def link_entity(
         self,
         entity: str,
@@ -286,26 +341,16 @@ class KBEntityLinker(Component, Serializable):
         template_found: Optional[str] = None,
         entity_types: List[str] = None,
         cut_entity: bool = False,
+        candidate_entities: Optional[List[Tuple[int, str, int, int]]] = None,
     ) -> Tuple[List[str], List[float]]:
         confidences = []
         tokens_match_conf = []
         if not entity:
             entities_ids = ["None"]
         else:
-            entity_is_uttr = False
-            lets_talk_phrases = ["let's talk", "let's chat", "what about", "do you know", "tell me about"]
-            found_lets_talk_phrase = any([phrase in short_context for phrase in lets_talk_phrases])
-            if (
-                short_context
-                and (entity == short_context or entity == short_context[:-1] or found_lets_talk_phrase)
-                and len(entity.split()) == 1
-            ):
-                lemm_entity = self.lemmatize_substr(entity)
-                entity_is_uttr = True
-            else:
-                lemm_entity = entity
-
-            candidate_entities = self.candidate_entities_inverted_index(lemm_entity)
+            lemm_entity, entity_is_uttr = self.lemmatize_entity(entity, short_context)
+            if candidate_entities is None:
+                candidate_entities = self.candidate_entities_inverted_index(lemm_entity)
             if self.types_dict:
                 if entity_types:
                     entity_types = set(entity_types)
@@ -342,50 +387,99 @@ class KBEntityLinker(Component, Serializable):
         words_with_freq = sorted(words_with_freq, key=lambda x: x[1])
         return words_with_freq[0][0]
 
-    def candidate_entities_inverted_index(self, entity: str) -> List[Tuple[Any, Any, Any]]:
+    def find_index_tokens(self, tok: str) -> Tuple[str, ...]:
+        """Find the keys of the inverted index for the token: the token itself, its lemma and, if neither of them
+        is in the index, the keys with Levenshtein distance 1 from the token.
+        """
+        index_tokens = []
+        if tok in self.inverted_index:
+            index_tokens.append(tok)
+
+        if self.lemmatize:
+            if self.lang_str == "@ru":
+                morph_parse_tok = self.morph.parse(tok)[0]
+                lemmatized_tok = morph_parse_tok.normal_form
+            if self.lang_str == "@en":
+                lemmatized_tok = self.lemmatizer.lemmatize(tok)
+
+            if lemmatized_tok != tok and lemmatized_tok in self.inverted_index:
+                index_tokens.append(lemmatized_tok)
+
+        if not index_tokens and self.use_prefix_tree:
+            words_with_levens_1 = self.searcher.search(tok, d=1)
+            index_tokens += [word[0] for word in words_with_levens_1]
+        return tuple(index_tokens)
+
+    def token_postings(self, tok: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Numbers and popularities of the entities with the token in labels, every entity is taken once.
+
+        The postings of a single index key in the arrays format are returned as slices of the memory-mapped arrays,
+        they are sorted by entity number with one posting per entity.
+        """
+        index_tokens = self.find_index_tokens(tok)
+        if self.index_format == "arrays" and len(index_tokens) == 1:
+            return self.inverted_index.postings(index_tokens[0])
+        entities_for_tok, freqs_for_tok = [], []
+        for index_tok in index_tokens:
+            if self.index_format == "arrays":
+                entities, freqs = self.inverted_index.postings(index_tok)
+            else:
+                postings = np.array(self.inverted_index[index_tok], dtype=np.int64).reshape(-1, 2)
+                entities, freqs = postings[:, 0], postings[:, 1]
+            entities_for_tok.append(entities)
+            freqs_for_tok.append(freqs)
+        if not entities_for_tok:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        entities, first_positions = np.unique(np.concatenate(entities_for_tok), return_index=True)
+        return entities, np.concatenate(freqs_for_tok)[first_positions]
+
+    def entity_tokens(self, entity: str) -> List[str]:
         word_tokens = nltk.word_tokenize(entity.lower())
-        word_tokens = [word for word in word_tokens if word not in self.stopwords]
-        candidate_entities = []
-
-        candidate_entities_for_tokens = []
-        for tok in word_tokens:
-            candidate_entities_for_tok = set()
-            if len(tok) > 1:
-                found = False
-                if tok in self.inverted_index:
-                    candidate_entities_for_tok = set(self.inverted_index[tok])
-                    found = True
-
-                if self.lemmatize:
-                    if self.lang_str == "@ru":
-                        morph_parse_tok = self.morph.parse(tok)[0]
-                        lemmatized_tok = morph_parse_tok.normal_form
-                    if self.lang_str == "@en":
-                        lemmatized_tok = self.lemmatizer.lemmatize(tok)
-
-                    if lemmatized_tok != tok and lemmatized_tok in self.inverted_index:
-                        candidate_entities_for_tok = candidate_entities_for_tok.union(
-                            set(self.inverted_index[lemmatized_tok])
-                        )
-                        found = True
-
-                if not found and self.use_prefix_tree:
-                    words_with_levens_1 = self.searcher.search(tok, d=1)
-                    for word in words_with_levens_1:
-                        candidate_entities_for_tok = candidate_entities_for_tok.union(set(self.inverted_index[word[0]]))
-                candidate_entities_for_tokens.append(candidate_entities_for_tok)
-
-        for candidate_entities_for_tok in candidate_entities_for_tokens:
-            candidate_entities += list(candidate_entities_for_tok)
-        candidate_entities = Counter(candidate_entities).most_common()
-        candidate_entities = sorted(candidate_entities, key=lambda x: (x[0][1], x[1]), reverse=True)
-        candidate_entities = candidate_entities[:1000]
-        candidate_entities = [
-            (entity_num, self.entities_list[entity_num], entity_freq, count)
-            for (entity_num, entity_freq), count in candidate_entities
-        ]
+        return [word for word in word_tokens if word not in self.stopwords and len(word) > 1]
+
+    def candidate_entities_inverted_index(self, entity: str) -> List[Tuple[Any, Any, Any]]:
+        return self.candidate_entities_inverted_index_batch([entity])[0]
+
+    def candidate_entities_inverted_index_batch(
+        self, entities: List[str], num_candidates: int = 1000
+    ) -> List[List[Tuple[int, str, int, int]]]:
+        """Find candidate entities for every mention: the entities which have the most popular among the tokens of
+        the mention in their labels. The postings of the tokens shared by the mentions are looked up once.
+
+        Returns:
+            for every mention the list of (entity number, entity id, entity popularity, number of matched tokens)
+            sorted by popularity and number of matched tokens
+        """
+        tokens_batch = [self.entity_tokens(entity) if entity else [] for entity in entities]
+        postings_dict = {tok: self.token_postings(tok) for tokens in tokens_batch for tok in tokens}
+
+        candidate_entities_batch = []
+        for tokens in tokens_batch:
+            postings = [postings_dict[tok] for tok in tokens]
+            postings = [(entities, freqs) for entities, freqs in postings if len(entities)]
+            if not postings:
+                candidate_entities_batch.append([])
+                continue
+            entity_nums, first_positions, counts = np.unique(
+                np.concatenate([entities for entities, _ in postings]), return_index=True, return_counts=True
+            )
+            freqs = np.concatenate([freqs for _, freqs in postings])[first_positions].astype(np.int64)
+            # order by popularity, then by the number of matched tokens
+            sort_keys = freqs * (counts.max() + 1) + counts
+            top_nums = np.arange(len(sort_keys))
+            if len(sort_keys) > num_candidates:
+                top_nums = np.argpartition(-sort_keys, num_candidates - 1)[:num_candidates]
+            top_nums = top_nums[np.argsort(-sort_keys[top_nums], kind="stable")]
+            candidate_entities_batch.append(
+                [
+                    (entity_num, self.entities_list[entity_num], entity_freq, count)
+                    for entity_num, entity_freq, count in zip(
+                        entity_nums[top_nums].tolist(), freqs[top_nums].tolist(), counts[top_nums].tolist()
+                    )
+                ]
+            )
 
-        return candidate_entities
+        return candidate_entities_batch
 
     def sort_found_entities(
         self,
@@ -1,3 +1,4 @@
 #!/bin/bash
 
 python test_el.py
+python test_inverted_index_arrays.py
@@ -0,0 +1,70 @@
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from inverted_index_arrays import ArrayInvertedIndex, Q2NameTable, StringTable, convert_inverted_index
+
+
+def build_dict_index(q2name, freqs):
+    # inverted index in the pickle format: token -> list of (entity number, entity popularity)
+    inverted_index = {}
+    for entity_num, names in enumerate(q2name):
+        for name in names:
+            for token in name.lower().split():
+                inverted_index.setdefault(token, []).append((entity_num, freqs[entity_num]))
+    return inverted_index
+
+
+class ArrayInvertedIndexTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(31415)
+        vocab = ["forrest", "gump", "tom", "hanks", "movie", "new", "york", "city", "über", "café", "1994"]
+        self.entities_list = [f"Q{i}" for i in range(300)]
+        self.q2name = [
+            [" ".join(random.choices(vocab, k=random.randint(1, 4))) for _ in range(random.randint(1, 3))]
+            for _ in self.entities_list
+        ]
+        self.freqs = [random.randint(0, 50) for _ in self.entities_list]
+        self.inverted_index = build_dict_index(self.q2name, self.freqs)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        convert_inverted_index(self.inverted_index, self.entities_list, self.q2name, self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_lookups_match_dict_index(self):
+        index = ArrayInvertedIndex(self.tmp_dir.name)
+        self.assertEqual(sorted(self.inverted_index), list(index.keys()))
+        self.assertEqual(len(self.inverted_index), len(index))
+        for token, postings in self.inverted_index.items():
+            self.assertIn(token, index)
+            self.assertEqual(sorted(set(postings)), index[token])
+            entities, freqs = index.postings(token)
+            self.assertIsInstance(entities, np.memmap)
+            self.assertTrue(np.all(np.diff(entities) > 0))
+            expected_entities, first_positions = np.unique([num for num, _ in postings], return_index=True)
+            np.testing.assert_array_equal(entities, expected_entities)
+            np.testing.assert_array_equal(freqs, np.array([freq for _, freq in postings])[first_positions])
+        for token in ["", "gum", "zzz", "Forrest"]:
+            self.assertNotIn(token, index)
+            self.assertEqual(len(index.postings(token)[0]), 0)
+            with self.assertRaises(KeyError):
+                index[token]
+
+    def test_string_tables(self):
+        self.assertEqual(self.entities_list, list(StringTable(self.tmp_dir.name, "entities")))
+        q2name = Q2NameTable(self.tmp_dir.name)
+        self.assertEqual(len(self.q2name), len(q2name))
+        self.assertEqual(self.q2name, [q2name[entity_num] for entity_num in range(len(q2name))])
+
+    def test_one_posting_per_entity(self):
+        inverted_index = {"gump": [(3, 7), (1, 2), (3, 5), (1, 2)]}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            convert_inverted_index(inverted_index, self.entities_list, self.q2name, tmp_dir)
+            self.assertEqual([(1, 2), (3, 5)], ArrayInvertedIndex(tmp_dir)["gump"])
+
+
+if __name__ == "__main__":
+    unittest.main()
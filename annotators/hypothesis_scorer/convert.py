@@ -6,6 +6,7 @@
 # MODEL_PATH=........../convert_data/convert
 import logging
 import os
+from collections import OrderedDict
 
 import numpy as np
 import sentry_sdk
@@ -22,6 +23,7 @@ logger = logging.getLogger(__name__)
 tensorflow_text.__name__
 
 MODEL_PATH = "/convert/convert"
+RESPONSE_ENCODINGS_CACHE_SIZE = int(os.getenv("RESPONSE_ENCODINGS_CACHE_SIZE", 10000))
 
 sess = tf.InteractiveSession(graph=tf.Graph())
 
@@ -74,8 +76,32 @@ def encode_responses(texts):
     return sess.run(response_encoding_tensor, feed_dict={responce_text_placeholder: texts})
 
 
+response_encodings_cache = OrderedDict()
+
+
+def encode_responses_cached(texts):
+    """Encode responses, template responses repeat from turn to turn, so encodings are kept in LRU cache."""
+    encodings = {}
+    for text in texts:
+        if text in response_encodings_cache:
+            response_encodings_cache.move_to_end(text)
+            encodings[text] = response_encodings_cache[text]
+    new_texts = list(dict.fromkeys(text for text in texts if text not in encodings))
+    if new_texts:
+        for text, encoding in zip(new_texts, encode_responses(new_texts)):
+            encodings[text] = encoding
+            response_encodings_cache[text] = encoding
+        while len(response_encodings_cache) > RESPONSE_ENCODINGS_CACHE_SIZE:
+            response_encodings_cache.popitem(last=False)
+    return np.stack([encodings[text] for text in texts])
+
+
 def get_convert_score(contexts, responses):
-    context_encodings = encode_contexts(contexts)
-    response_encodings = encode_responses(responses)  # 79, 512
+    # hypotheses of a turn share the context, so every distinct context is encoded once
+    context_keys = [tuple(context) for context in contexts]
+    unique_contexts = list(dict.fromkeys(context_keys))
+    context_indices = {context: i for i, context in enumerate(unique_contexts)}
+    context_encodings = encode_contexts(unique_contexts)[[context_indices[context] for context in context_keys]]
+    response_encodings = encode_responses_cached(responses)  # 79, 512
     res = np.multiply(context_encodings, response_encodings)
     return np.sum(res, axis=1).reshape(-1, 1)
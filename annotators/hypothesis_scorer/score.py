@@ -3,30 +3,40 @@ import convert
 import numpy as np
 
 
-def get_midas_features_human(contexts):
+def get_midas_features(requests):
+    # requests repeat, e.g. the human request is the same for all hypotheses of a turn
+    unique_requests = list(dict.fromkeys(requests))
+    res = midas.predict(unique_requests)
+    features = {request: list(x.values()) for request, x in zip(unique_requests, res)}
+    return [features[request] for request in requests]
+
+
+def get_midas_requests_human(contexts):
     requests = []
     for context in contexts:
         last_human = context[-1]
         last_bot = context[-2] if len(context) > 1 else ""
         item = last_bot + " : EMPTY > " + last_human
         requests.append(item)
+    return requests
 
-    res = midas.predict(requests)
-    res = [list(x.values()) for x in res]
-    return res
 
-
-def get_midas_features_bot(contexts, hypotheses):
+def get_midas_requests_bot(contexts, hypotheses):
     requests = []
     for context, hyp in zip(contexts, hypotheses):
         last_human = context[-1]
         cur_bot = hyp["text"]
         item = last_human + " : EMPTY > " + cur_bot
         requests.append(item)
+    return requests
 
-    res = midas.predict(requests)
-    res = [list(x.values()) for x in res]
-    return res
+
+def get_midas_features_human(contexts):
+    return get_midas_features(get_midas_requests_human(contexts))
+
+
+def get_midas_features_bot(contexts, hypotheses):
+    return get_midas_features(get_midas_requests_bot(contexts, hypotheses))
 
 
 def get_features(contexts, hypotheses):
@@ -34,8 +44,12 @@ def get_features(contexts, hypotheses):
 
     X_conv = convert.get_convert_score(contexts, [hyp["text"] for hyp in hypotheses])
 
-    midas_features_bot = get_midas_features_bot(contexts, hypotheses)
-    midas_features_human = get_midas_features_human(contexts)
+    # one MIDAS run for the bot and human requests
+    midas_features = get_midas_features(
+        get_midas_requests_bot(contexts, hypotheses) + get_midas_requests_human(contexts)
+    )
+    midas_features_bot = midas_features[: len(hypotheses)]
+    midas_features_human = midas_features[len(hypotheses) :]
     X_midas = np.hstack([midas_features_bot, midas_features_human])
 
     return np.concatenate([X_conf, X_conv, X_midas], axis=1)
@@ -0,0 +1,54 @@
+import json
+import logging
+
+import numpy as np
+from catboost import CatBoostClassifier
+
+import convert
+import midas
+from score import get_features, get_midas_requests_bot, get_midas_requests_human
+
+logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_features_per_hypothesis(contexts, hypotheses):
+    # features as they were computed before grouping by context: every model run gets a row per hypothesis
+    X_conf = np.array([hyp["confidence"] for hyp in hypotheses]).reshape(-1, 1)
+
+    context_encodings = convert.encode_contexts(contexts)
+    response_encodings = convert.encode_responses([hyp["text"] for hyp in hypotheses])
+    X_conv = np.sum(np.multiply(context_encodings, response_encodings), axis=1).reshape(-1, 1)
+
+    midas_features_bot = [list(x.values()) for x in midas.predict(get_midas_requests_bot(contexts, hypotheses))]
+    midas_features_human = [list(x.values()) for x in midas.predict(get_midas_requests_human(contexts))]
+    X_midas = np.hstack([midas_features_bot, midas_features_human])
+
+    return np.concatenate([X_conf, X_conv, X_midas], axis=1)
+
+
+def test_features():
+    with open("test_data.json") as f:
+        dialogs = json.load(f)
+    contexts, hypotheses = [], []
+    for sample in dialogs:
+        for hyp in sample["hyp"]:
+            contexts += [sample["context"]]
+            hypotheses += [hyp]
+
+    cb = CatBoostClassifier()
+    cb.load_model("model-confidence-convert-old_midas.cbm")
+
+    old_features = get_features_per_hypothesis(contexts, hypotheses)
+    old_probas = cb.predict_proba(old_features)
+    # the second run takes the response encodings from the cache
+    for _ in range(2):
+        features = get_features(contexts, hypotheses)
+        assert features.dtype == old_features.dtype and features.shape == old_features.shape
+        assert np.array_equal(features, old_features), f"max diff {np.abs(features - old_features).max()}"
+        assert np.array_equal(cb.predict_proba(features), old_probas)
+    logger.info("Success!")
+
+
+if __name__ == "__main__":
+    test_features()
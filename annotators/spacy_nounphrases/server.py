@@ -1,6 +1,8 @@
 import logging
 import re
+import threading
 import time
+from collections import OrderedDict
 from os import getenv
 
 import en_core_web_sm
@@ -11,10 +13,16 @@ from common.ignore_lists import FALSE_POS_NPS_LIST
 
 #  import spacy - not worked
 #  nlp = spacy.load("en_core_web_sm") - not worked
-nlp = en_core_web_sm.load()
+# named entities are not used, noun chunks need only tagger and parser
+nlp = en_core_web_sm.load(disable=["ner"])
 
 sentry_sdk.init(getenv("SENTRY_DSN"))
 
+CACHE_SIZE = int(getenv("NOUNPHRASES_CACHE_SIZE", 10000))
+# number of processes for nlp.pipe, used for batches of at least N_PROCESS_MIN_BATCH_SIZE texts
+N_PROCESS = int(getenv("N_PROCESS", 1))
+N_PROCESS_MIN_BATCH_SIZE = int(getenv("N_PROCESS_MIN_BATCH_SIZE", 64))
+
 
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -27,34 +35,55 @@ words_ignore_in_np = re.compile(r"(which|what)", re.IGNORECASE)
 FALSE_POS_NPS_LIST = set(FALSE_POS_NPS_LIST)
 
 
-def noun_phrase_extraction(input_text):
-    if input_text:
-        input_text = input_text.lower()
-        doc = nlp(input_text)
-        noun_chunks = [str(nounph) for nounph in doc.noun_chunks if str(nounph) not in FALSE_POS_NPS_LIST]
+def noun_phrase_extraction(doc):
+    noun_chunks = [str(nounph) for nounph in doc.noun_chunks if str(nounph) not in FALSE_POS_NPS_LIST]
+
+    # based on dependency parsing these should be the most likely topics
+    augmented_noun_chunks = []
+
+    subjects = [token for token in doc if any([t in token.dep_ for t in ["obj", "subj", "comp"]]) and not token.is_stop]
+    subjects = [str(subject) for subject in subjects]
+
+    augmented_noun_chunks = [nounph for subject in subjects for nounph in noun_chunks if subject in nounph.split()]
+    augmented_noun_chunks = list(set(augmented_noun_chunks))
+
+    if not augmented_noun_chunks:
+        # if only one word is VBG, add it to the list
+        vbg = [token for token in doc if ("VBG" == token.tag_)]
+        if len(vbg) == 1:
+            noun_chunks.extend([vbg[0].text])
+        return noun_chunks
+
+    augmented_noun_chunks = [re.sub(words_ignore_in_np, "", nounph).strip() for nounph in augmented_noun_chunks]
+
+    return augmented_noun_chunks
 
-        # based on dependency parsing these should be the most likely topics
-        augmented_noun_chunks = []
 
-        subjects = [
-            token for token in doc if any([t in token.dep_ for t in ["obj", "subj", "comp"]]) and not token.is_stop
-        ]
-        subjects = [str(subject) for subject in subjects]
+nounphrases_cache = OrderedDict()
+nounphrases_cache_lock = threading.Lock()
 
-        augmented_noun_chunks = [nounph for subject in subjects for nounph in noun_chunks if subject in nounph.split()]
-        augmented_noun_chunks = list(set(augmented_noun_chunks))
 
-        if not augmented_noun_chunks:
-            # if only one word is VBG, add it to the list
-            vbg = [token for token in doc if ("VBG" == token.tag_)]
-            if len(vbg) == 1:
-                noun_chunks.extend([vbg[0].text])
-            return noun_chunks
+def noun_phrase_extraction_batch(input_texts):
+    """Extracts nounphrases from the lowercased texts, the texts which are not in cache are parsed in one batch."""
+    input_texts = [input_text.lower() if input_text else "" for input_text in input_texts]
+    nounphrases = {"": []}
+    with nounphrases_cache_lock:
+        for text in input_texts:
+            if text in nounphrases_cache:
+                nounphrases_cache.move_to_end(text)
+                nounphrases[text] = nounphrases_cache[text]
 
-        augmented_noun_chunks = [re.sub(words_ignore_in_np, "", nounph).strip() for nounph in augmented_noun_chunks]
+    new_texts = list(dict.fromkeys(text for text in input_texts if text not in nounphrases))
+    n_process = N_PROCESS if len(new_texts) >= N_PROCESS_MIN_BATCH_SIZE else 1
+    for text, doc in zip(new_texts, nlp.pipe(new_texts, n_process=n_process)):
+        nounphrases[text] = noun_phrase_extraction(doc)
 
-        return augmented_noun_chunks
-    return []
+    with nounphrases_cache_lock:
+        for text in new_texts:
+            nounphrases_cache[text] = nounphrases[text]
+        while len(nounphrases_cache) > CACHE_SIZE:
+            nounphrases_cache.popitem(last=False)
+    return [list(nounphrases[text]) for text in input_texts]
 
 
 symbols_for_nounphrases = re.compile(r"[^0-9a-zA-Z \-]+")
@@ -66,7 +95,7 @@ def get_result(request):
     sentences = request.json["sentences"]
     logger.debug(f"Input sentences: {sentences}")
 
-    nounphrases_batch = [noun_phrase_extraction(sentence) for sentence in sentences]
+    nounphrases_batch = noun_phrase_extraction_batch(sentences)
     nounphrases_batch = [
         [re.sub(symbols_for_nounphrases, "", nounph).strip() for nounph in nounphrases]
         for nounphrases in nounphrases_batch
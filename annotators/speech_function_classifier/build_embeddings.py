@@ -0,0 +1,12 @@
+"""Computes the embeddings of the training dialogues at image build time.
+
+models.py memory-maps the embeddings from EMBEDDINGS_DIR on import and recomputes them only if the dialogues
+or the name or revision of the embedding model have changed.
+"""
+import logging
+
+logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+
+import models  # noqa: E402
+
+logging.getLogger(__name__).info(f"Embeddings of the training dialogues: {models.all_outputs.shape}")
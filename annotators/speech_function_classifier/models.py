@@ -1,4 +1,7 @@
+import hashlib
 import json
+import logging
+import os
 import pickle
 import re
 from collections import defaultdict
@@ -18,11 +21,13 @@ from sklearn.ensemble import GradientBoostingClassifier
 # from sklearn.svm import SVC
 from transformers import AutoTokenizer, AutoModel
 
+logger = logging.getLogger(__name__)
+
 nlp = spacy.load("en_core_web_sm")
 
 cuda_is_available = torch.cuda.is_available()
 
-with open("data/res_cor.json") as data:
+with open("/models/res_cor.json") as data:
     res_cor = json.load(data)
 
 with open("/models/track_list.txt") as track_list:
@@ -200,31 +205,61 @@ cut_train_labels = get_cut_labels(train_labels)
 
 cut_test_labels = get_cut_labels(test_labels)
 
-tokenizer = AutoTokenizer.from_pretrained("DeepPavlov/bert-base-cased-conversational")
-embed_model = AutoModel.from_pretrained("DeepPavlov/bert-base-cased-conversational")
+EMBED_MODEL_NAME = "DeepPavlov/bert-base-cased-conversational"
+EMBED_MODEL_REVISION = os.getenv("EMBED_MODEL_REVISION", "main")
+EMBEDDINGS_DIR = os.getenv("EMBEDDINGS_DIR", "/models")
+EMBEDDINGS_BATCH_SIZE = int(os.getenv("EMBEDDINGS_BATCH_SIZE", 32))
+
+tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_NAME, revision=EMBED_MODEL_REVISION)
+embed_model = AutoModel.from_pretrained(EMBED_MODEL_NAME, revision=EMBED_MODEL_REVISION)
 
 if cuda_is_available:
     embed_model.to("cuda")
 
 
-def get_embeddings(data):
+def get_embeddings(data, batch_size=EMBEDDINGS_BATCH_SIZE):
     outputs = []
-    for text in data:
+    for i in range(0, len(data), batch_size):
         with torch.no_grad():
-            input_ph = tokenizer(text, padding=True, truncation=True, max_length=30, return_tensors="pt")
+            input_ph = tokenizer(
+                data[i : i + batch_size], padding=True, truncation=True, max_length=30, return_tensors="pt"
+            )
             if cuda_is_available:
                 input_ph.to("cuda")
             output_ph = embed_model(**input_ph)
             #        train_outputs.append(output_ph.pooler_output.cpu().numpy())
-            sentence_embedding = output_ph.last_hidden_state.mean(dim=1).cpu().numpy()
-        outputs.append(sentence_embedding)
-    outputs = np.concatenate(outputs)
+            # mean over the tokens of every text without padding
+            mask = input_ph["attention_mask"].unsqueeze(-1).type_as(output_ph.last_hidden_state)
+            sentence_embedding = (output_ph.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1)
+        outputs.append(sentence_embedding.cpu().numpy())
+    outputs = np.concatenate(outputs) if outputs else np.zeros((0, embed_model.config.hidden_size), dtype=np.float32)
     return outputs
 
 
-all_outputs = []
-all_outputs.extend(get_embeddings(train_data))
-all_outputs.extend(get_embeddings(test_data))
+def get_embeddings_checksum(data):
+    """Checksum of the texts and the name and revision of the embedding model."""
+    checksum = hashlib.sha256(json.dumps([EMBED_MODEL_NAME, EMBED_MODEL_REVISION, data]).encode("utf-8"))
+    return checksum.hexdigest()[:16]
+
+
+def load_or_compute_embeddings(data, name):
+    """
+    Memory-maps the embeddings of the texts from `{name}_{checksum}.npy` in EMBEDDINGS_DIR,
+    computes and saves them if there is no file for the current texts and model.
+    """
+    embeddings_path = os.path.join(EMBEDDINGS_DIR, f"{name}_{get_embeddings_checksum(data)}.npy")
+    if os.path.exists(embeddings_path):
+        logger.info(f"Loading embeddings from {embeddings_path}")
+        return np.load(embeddings_path, mmap_mode="r")
+    logger.info(f"Computing embeddings of {len(data)} texts to {embeddings_path}")
+    embeddings = get_embeddings(data)
+    tmp_path = f"{embeddings_path}.tmp.npy"
+    np.save(tmp_path, embeddings)
+    os.replace(tmp_path, embeddings_path)
+    return np.load(embeddings_path, mmap_mode="r")
+
+
+all_outputs = load_or_compute_embeddings(train_data + test_data, "train_embeddings")
 
 all_cuts = []
 all_cuts.extend(cut_train_labels)
@@ -347,29 +382,33 @@ def divide_into_sentences(document):
     return [sent for sent in document.sents]
 
 
-def predict(test_sent):
-    parsed_test = divide_into_sentences(nlp(test_sent))
-    # Get features
-    sentence_with_features = {}
-    entities_dict = number_of_specific_entities(parsed_test[0])
-    sentence_with_features.update(entities_dict)
-    pos_dict = number_of_fine_grained_pos_tags(parsed_test[0])
-    sentence_with_features.update(pos_dict)
-    # dep_dict = number_of_dependency_tags(parsed_test[0])
-    # sentence_with_features.update(dep_dict)
-    df = pd.DataFrame(sentence_with_features, index=[0])
+def predict(test_docs):
+    features = []
+    for test_doc in test_docs:
+        parsed_test = divide_into_sentences(test_doc)
+        # Get features
+        sentence_with_features = {}
+        entities_dict = number_of_specific_entities(parsed_test[0])
+        sentence_with_features.update(entities_dict)
+        pos_dict = number_of_fine_grained_pos_tags(parsed_test[0])
+        sentence_with_features.update(pos_dict)
+        # dep_dict = number_of_dependency_tags(parsed_test[0])
+        # sentence_with_features.update(dep_dict)
+        features.append(sentence_with_features)
+    df = pd.DataFrame(features, index=range(len(features)))
     df = scaler.transform(df)
 
-    prediction = nn_classifier.predict(df)
-    if prediction == 0:
-        open_tag = "Fact"
-    else:
-        open_tag = "Opinion"
-    return open_tag
+    predictions = nn_classifier.predict(df)
+    open_tags = []
+    for i in range(len(predictions)):
+        if predictions[i : i + 1] == 0:
+            open_tags.append("Fact")
+        else:
+            open_tags.append("Opinion")
+    return open_tags
 
 
-def get_open_labels(phrase, y_pred):
-    open_tag = predict(phrase)
+def get_open_labels(phrase, y_pred, open_tag, doc):
     if open_tag == "Fact":
         if "?" not in phrase:
             open_tag = "Give.Fact"
@@ -383,7 +422,6 @@ def get_open_labels(phrase, y_pred):
     y_pred = y_pred + open_tag
     if len(word_tokenize(phrase)) < 4:
         poses = []
-        doc = nlp(phrase)
         for token in doc:
             poses.append(token.pos_)
         if "PROPN" in poses:
@@ -412,11 +450,7 @@ def check_develop(y_pred, y_pred_previous, current_speaker, previous_speaker):
 # boosting_model_sus.fit(train_sustains,sus_tags)
 
 
-def get_label_for_sustains(phrase, y_pred):
-    test_sustains = []
-    test_sustains.append(phrase)
-    test_sustains_emb = get_embeddings(test_sustains)
-    tags_for_sus = sustain_classifier.predict(test_sustains_emb)
+def get_label_for_sustains(phrase, y_pred, tags_for_sus):
     if y_pred == "Sustain.Continue.":
         y_pred = "".join(tags_for_sus)
     if y_pred == "React.Respond.Support.Develop.":
@@ -460,7 +494,7 @@ for line in track_list:
 # que_model.fit(train_em_que, train_tags)
 
 
-def get_label_for_question(phrase, y_pred, current_speaker, previous_speaker):
+def get_label_for_question(phrase, y_pred, current_speaker, previous_speaker, y_pred_track):
     interrogative_words = [
         "whose",
         "what",
@@ -474,10 +508,6 @@ def get_label_for_question(phrase, y_pred, current_speaker, previous_speaker):
         "when",
         "how",
     ]
-    questions = list()
-    questions.append(phrase)
-    question_embeddings = get_embeddings(questions)
-    y_pred_track = question_classifier.predict(question_embeddings)
     tag_for_track = map_tracks(y_pred_track)
     if current_speaker != previous_speaker:
         if y_pred == "React.Respond." and tag_for_track != "5":
@@ -533,7 +563,17 @@ def get_label_for_question(phrase, y_pred, current_speaker, previous_speaker):
 # svc_responds.fit(responds_concatenate,respond_tags)
 
 
-def get_label_for_responds(phrase, previous_phrase, y_pred, y_pred_previous, current_speaker, previous_speaker):
+def get_label_for_responds(
+    phrase,
+    previous_phrase,
+    y_pred,
+    y_pred_previous,
+    current_speaker,
+    previous_speaker,
+    tag_for_respond,
+    doc,
+    try_replies_doc,
+):
     confront_labels = ["Reply.Disawow", "Reply.Disagree", "Reply.Contradict"]
     support_labels = [
         "Reply.Acknowledge",
@@ -543,21 +583,15 @@ def get_label_for_responds(phrase, previous_phrase, y_pred, y_pred_previous, cur
         "Develop.Enhance",
         "Develop.Extend",
     ]
-    try_replies = []
-    test_prev_lines = []
-    test_responds = []
-    test_responds_prev_lines = []
+    try_replies = [phrase]
     if "?" in previous_phrase:
         if current_speaker != previous_speaker:
-            test_prev_lines.append(previous_phrase)
-            try_replies.append(phrase)
-            test_concat = np.concatenate([get_embeddings(try_replies), get_embeddings(test_prev_lines)], axis=1)
-            tag_for_reply = replies_classifier.predict(test_concat)
+            tag_for_reply = tag_for_respond
             if tag_for_reply == "Reply.Decline" or tag_for_reply == "Reply.Disagree":
                 tag_for_reply = "Reply.Contradict"
             if "yes" in str(try_replies).lower():
                 tag_for_reply = "Reply.Affirm"
-            for token in nlp(str(try_replies)):
+            for token in try_replies_doc:
                 if token.dep_ == "neg" or token.text == "no":
                     if tag_for_reply in support_labels[:3]:
                         tag_for_reply = "Reply.Contradict"
@@ -568,45 +602,30 @@ def get_label_for_responds(phrase, previous_phrase, y_pred, y_pred_previous, cur
             if "Response.Resolve." in tag_for_reply:
                 y_pred = "React.Rejoinder.Support.Response.Resolve"
         else:
-            test_responds_prev_lines.append(previous_phrase)
-            test_responds.append(phrase)
-            test_responds_concatenate = np.concatenate(
-                [
-                    get_embeddings(test_responds),
-                    get_embeddings(test_responds_prev_lines),
-                ],
-                axis=1,
-            )
-            tags_for_responds = respond_classifier.predict(test_responds_concatenate)
+            tags_for_responds = tag_for_respond
             if tags_for_responds in confront_labels:
                 y_pred = y_pred + "Confront." + "".join(tags_for_responds)
             if tags_for_responds in support_labels:
                 y_pred = y_pred + "Support." + "".join(tags_for_responds)
-            for token in nlp(phrase):
+            for token in doc:
                 if token.dep_ == "neg":
                     return "React.Rejoinder.Confront.Challenge.Counter"
     else:
-        test_responds_prev_lines.append(previous_phrase)
-        test_responds.append(phrase)
-        test_responds_concatenate = np.concatenate(
-            [get_embeddings(test_responds), get_embeddings(test_responds_prev_lines)],
-            axis=1,
-        )
-        tags_for_responds = respond_classifier.predict(test_responds_concatenate)
+        tags_for_responds = tag_for_respond
         if tags_for_responds in support_labels:
             y_pred = y_pred + "Support." + "".join(tags_for_responds)
         elif tags_for_responds in confront_labels:
             y_pred = y_pred + "Confront." + "".join(tags_for_responds)
         else:
             y_pred = y_pred + "".join(tags_for_responds)
-        for token in nlp(phrase):
+        for token in doc:
             if token.dep_ == "neg":
                 y_pred = "React.Rejoinder.Confront.Challenge.Counter"
     return y_pred
 
 
-def get_labels_for_rejoinder(phrase, previous_phrase, current_speaker, previous_speaker):
-    for token in nlp(phrase):
+def get_labels_for_rejoinder(phrase, previous_phrase, current_speaker, previous_speaker, doc):
+    for token in doc:
         if token.dep_ == "neg":
             y_pred = "React.Rejoinder.Confront.Challenge.Counter"
             return y_pred
@@ -630,31 +649,105 @@ def check_functions(y_pred, current_speaker, prev_speaker):
     return y_pred
 
 
+def uses_replies_classifier(phrase, prev_phrase, speaker, previous_speaker):
+    return "?" in prev_phrase and speaker != previous_speaker
+
+
+def get_speech_functions_batch(dialogs):
+    """
+    Classifies the phrases of several dialogs at once.
+    Every dialog is a pair of the list of samples (phrase, prev_phrase, speaker, previous_speaker)
+    and the speech function of the phrase before the first sample. The speech function of every next
+    sample depends on the speech function of the previous one, so the labels are assigned sequentially,
+    but embeddings, spaCy parses and the predictions of every classifier are computed for all samples
+    at once beforehand.
+    """
+    samples = [sample for dialog_samples, _ in dialogs for sample in dialog_samples]
+    if not samples:
+        return [[] for _ in dialogs]
+    phrases = [phrase for phrase, _, _, _ in samples]
+    continued = [j for j, (_, prev_phrase, _, _) in enumerate(samples) if prev_phrase is not None]
+
+    texts = list(dict.fromkeys(phrases + [samples[j][1] for j in continued]))
+    embeddings = dict(zip(texts, get_embeddings(texts)))
+
+    def stacked_embeddings(indices, with_prev_phrase=False):
+        phrase_embeddings = np.stack([embeddings[samples[j][0]] for j in indices])
+        if not with_prev_phrase:
+            return phrase_embeddings
+        prev_phrase_embeddings = np.stack([embeddings[samples[j][1]] for j in indices])
+        return np.concatenate([phrase_embeddings, prev_phrase_embeddings], axis=1)
+
+    upper_preds = upper_class_predict(stacked_embeddings(range(len(samples))))
+    upper_labels = ["".join(list(upper_preds[j : j + 1])) for j in range(len(samples))]
+
+    replies_indices, responds_indices = [], []
+    for j in continued:
+        if upper_labels[j] == "React.Respond.":
+            if uses_replies_classifier(*samples[j]):
+                replies_indices.append(j)
+            else:
+                responds_indices.append(j)
+
+    doc_texts = list(dict.fromkeys(phrases + [str([samples[j][0]]) for j in replies_indices]))
+    docs = dict(zip(doc_texts, nlp.pipe(doc_texts)))
+
+    def predict_per_sample(classifier, indices, with_prev_phrase=False):
+        # slices of length one keep the semantics of the comparisons with single sample predictions
+        if not indices:
+            return {}
+        predictions = classifier.predict(stacked_embeddings(indices, with_prev_phrase))
+        return {j: predictions[i : i + 1] for i, j in enumerate(indices)}
+
+    open_indices = [j for j in range(len(samples)) if samples[j][1] is None or upper_labels[j] == "Open."]
+    open_tags = dict(zip(open_indices, predict([docs[phrases[j]] for j in open_indices]) if open_indices else []))
+    sustain_tags = predict_per_sample(
+        sustain_classifier, [j for j in continued if upper_labels[j] == "Sustain.Continue."]
+    )
+    track_tags = predict_per_sample(question_classifier, [j for j in continued if "?" in phrases[j]])
+    respond_tags = predict_per_sample(replies_classifier, replies_indices, with_prev_phrase=True)
+    respond_tags.update(predict_per_sample(respond_classifier, responds_indices, with_prev_phrase=True))
+
+    results = []
+    j = 0
+    for dialog_samples, prev_speech_function in dialogs:
+        speech_functions = [prev_speech_function]
+        for phrase, prev_phrase, speaker, previous_speaker in dialog_samples:
+            doc = docs[phrase]
+            y_pred = upper_labels[j]
+            if prev_phrase is None:
+                y_pred = get_open_labels(phrase, "Open.", open_tags[j], doc)
+            else:
+                if y_pred == "Open.":
+                    y_pred = get_open_labels(phrase, y_pred, open_tags[j], doc)
+                if y_pred == "Sustain.Continue.":
+                    y_pred = check_develop(y_pred, speech_functions[-1], speaker, previous_speaker)
+                    y_pred = get_label_for_sustains(phrase, y_pred, sustain_tags[j])
+                if "?" in phrase:
+                    y_pred = get_label_for_question(phrase, y_pred, speaker, previous_speaker, track_tags[j])
+                if y_pred == "React.Respond.":
+                    y_pred = get_label_for_responds(
+                        phrase,
+                        prev_phrase,
+                        y_pred,
+                        speech_functions[-1],
+                        speaker,
+                        previous_speaker,
+                        respond_tags[j],
+                        doc,
+                        docs.get(str([phrase])),
+                    )
+                if y_pred == "React.Rejoinder.":
+                    y_pred = get_labels_for_rejoinder(phrase, prev_phrase, speaker, previous_speaker, doc)
+            y_pred = check_functions(y_pred, speaker, previous_speaker)
+            speech_functions.append(y_pred)
+            j += 1
+        results.append(speech_functions[1:])
+    return results
+
+
 def get_speech_function(phrase, prev_phrase, prev_speech_function, speaker="John", previous_speaker="Doe"):
     # note: default values for current and previous speaker are only to make them different. In out case they are always
     # different (bot and human)
-    test_embeddings = get_embeddings([phrase])
-    y_pred = "".join(list(upper_class_predict(test_embeddings)))
-    if prev_phrase is None:
-        y_pred = get_open_labels(phrase, "Open.")
-    else:
-        if y_pred == "Open.":
-            y_pred = get_open_labels(phrase, y_pred)
-        if y_pred == "Sustain.Continue.":
-            y_pred = check_develop(y_pred, prev_speech_function, speaker, previous_speaker)
-            y_pred = get_label_for_sustains(phrase, y_pred)
-        if "?" in phrase:
-            y_pred = get_label_for_question(phrase, y_pred, speaker, previous_speaker)
-        if y_pred == "React.Respond.":
-            y_pred = get_label_for_responds(
-                phrase,
-                prev_phrase,
-                y_pred,
-                prev_speech_function,
-                speaker,
-                previous_speaker,
-            )
-        if y_pred == "React.Rejoinder.":
-            y_pred = get_labels_for_rejoinder(phrase, prev_phrase, speaker, previous_speaker)
-    y_pred = check_functions(y_pred, speaker, previous_speaker)
-    return y_pred
+    dialog = ([(phrase, prev_phrase, speaker, previous_speaker)], prev_speech_function)
+    return get_speech_functions_batch([dialog])[0][0]
@@ -4,15 +4,21 @@ import time
 from typing import Optional, List
 
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from nltk import sent_tokenize
 from pydantic import BaseModel
 from starlette.middleware.cors import CORSMiddleware
 
-from models import get_speech_function
+from common.inference_executor import BatchingInferenceExecutor, InferenceQueueFullError
+from models import get_speech_function, get_speech_functions_batch
 
 sentry_sdk.init(os.getenv("SENTRY_DSN"))
 
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 32))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", 0))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 128))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 1))
+
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -48,28 +54,54 @@ except Exception as e:
     raise e
 
 
-async def handler(payload: List[Payload]):
-    responses = [""] * len(payload)
+def get_dialog(p: Payload):
+    phrases = [p.prev_phrase] + p.phrase
+    authors = ["John"] + ["Doe"] * len(p.phrase)
+    samples = list(zip(phrases[1:], phrases[:-1], authors[1:], authors[:-1]))
+    return samples, p.prev_speech_function
+
+
+def handler(payload: List[Payload]):
+    dialogs = [get_dialog(p) for p in payload]
     try:
-        for i, p in enumerate(payload):
-            phrase_len = len(p.phrase)
-            phrases = [p.prev_phrase] + p.phrase
-            authors = ["John"] + ["Doe"] * phrase_len
-            response = [p.prev_speech_function]
-            for phr, prev_phr, auth, prev_auth in zip(phrases[1:], phrases[:-1], authors[1:], authors[:-1]):
-                speech_f = get_speech_function(phr, prev_phr, response[-1], auth, prev_auth)
-                response.append(speech_f)
-            responses[i] = response[1:]
+        return get_speech_functions_batch(dialogs)
     except Exception as e:
         sentry_sdk.capture_exception(e)
         logger.exception(e)
+    # classify the dialogs separately, so that an error in one of them does not affect the others
+    responses = [""] * len(payload)
+    for i, dialog in enumerate(dialogs):
+        try:
+            responses[i] = get_speech_functions_batch([dialog])[0]
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            logger.exception(e)
     return responses
 
 
+# the classifier runs in a worker thread, so that the event loop keeps accepting requests,
+# the payloads of the requests which arrive during inference are merged into the next batch
+executor = BatchingInferenceExecutor(
+    handler,
+    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=INFERENCE_MAX_WAIT_MS,
+    max_queue_size=INFERENCE_QUEUE_SIZE,
+    num_workers=INFERENCE_WORKERS,
+)
+
+
+async def run_inference(payload: List[Payload]):
+    try:
+        return await executor.submit(payload)
+    except InferenceQueueFullError as e:
+        logger.warning(f"speech_function_classifier is overloaded: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+
 @app.post("/model")
 async def answer(payload: Payload):
     st_time = time.time()
-    responses = await handler([payload])
+    responses = await run_inference([payload])
     total_time = time.time() - st_time
     logger.info(f"speech_function_classifier model exec time: {total_time:.3f}s")
     return responses
@@ -78,7 +110,7 @@ async def answer(payload: Payload):
 @app.post("/annotation")
 async def annotation(payload: List[AnnotationPayload]):
     st_time = time.time()
-    responses = await handler(
+    responses = await run_inference(
         [
             Payload(
                 phrase=sent_tokenize(p.phrase),
@@ -91,3 +123,8 @@ async def annotation(payload: List[AnnotationPayload]):
     total_time = time.time() - st_time
     logger.info(f"speech_function_classifier batch exec time: {total_time:.3f}s")
     return [{"batch": responses}]
+
+
+@app.get("/metrics")
+async def metrics():
+    return executor.metrics()
@@ -0,0 +1,58 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class QueryCache:
+    """Thread-safe LRU cache with time-to-live for the results of wiki_parser queries."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.storage = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(parser_info: str, query: Any) -> Tuple[str, str]:
+        return parser_info, json.dumps(query, sort_keys=True, ensure_ascii=False)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            item = self.storage.get(key)
+            if item is not None:
+                value, expiration_time = item
+                if expiration_time > time.monotonic():
+                    self.storage.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.storage[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.storage[key] = (value, time.monotonic() + self.ttl)
+            self.storage.move_to_end(key)
+            while len(self.storage) > self.max_size:
+                self.storage.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            requests_num = self.hits + self.misses
+            return {
+                "size": len(self.storage),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / requests_num if requests_num else 0.0,
+            }
@@ -4,7 +4,7 @@ import time
 from flask import Flask, request, jsonify
 import sentry_sdk
 from sentry_sdk.integrations.flask import FlaskIntegration
-from wiki_parser import wp_call
+from wiki_parser_pool import wp_call, query_cache, start_wp_pool
 from common.utils import remove_punctuation_from_dict_keys
 
 
@@ -13,6 +13,9 @@ logger = logging.getLogger(__name__)
 sentry_sdk.init(dsn=os.getenv("SENTRY_DSN"), integrations=[FlaskIntegration()])
 
 app = Flask(__name__)
+# worker processes re-import the main script as __mp_main__ when the service is run with `python server.py`
+if __name__ != "__mp_main__":
+    start_wp_pool()
 
 
 @app.route("/model", methods=["POST"])
@@ -35,5 +38,10 @@ def respond():
     return jsonify(res)
 
 
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify(query_cache.stats())
+
+
 if __name__ == "__main__":
     app.run(debug=False, host="0.0.0.0", port=3000)
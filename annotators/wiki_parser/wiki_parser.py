@@ -17,7 +17,6 @@ import itertools
 import json
 import os
 import re
-import multiprocessing as mp
 import logging
 from typing import List, Tuple, Dict, Any
 import sentry_sdk
@@ -674,16 +673,18 @@ else:
     top_people = find_top_people()
     genres_dict, people_genres_dict = extract_info()
 
-manager = mp.Manager()
 
-
-def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], utt_num: int, wiki_parser_output):
+def execute_queries_list(
+    parser_info_list: List[str], queries_list: List[Any], utt_num: int, wiki_parser_output, raise_errors: bool = False
+):
     for parser_info, query in zip(parser_info_list, queries_list):
         if parser_info == "find_rels":
             rels = []
             try:
                 rels = find_rels(*query)
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
@@ -741,6 +742,8 @@ def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], u
                                 entity_triplets_info = find_top_triplets(entity, entity_substr, n, token_conf, conf)
                                 animals_skill_triplets_info = {**animals_skill_triplets_info, **entity_triplets_info}
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
@@ -760,6 +763,8 @@ def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], u
                     if occ in top_people:
                         top_people_list.append(top_people[occ])
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
@@ -769,6 +774,8 @@ def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], u
             try:
                 rels = find_entities_rels(*query)
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
@@ -779,6 +786,8 @@ def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], u
                 entities1, entities2 = query
                 conn_info = list(find_connection(entities1, entities2))
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
@@ -803,6 +812,8 @@ def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], u
                 else:
                     log.debug("unsupported query type")
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
@@ -812,6 +823,8 @@ def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], u
             try:
                 objects = find_object(*query)
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
@@ -821,6 +834,8 @@ def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], u
             try:
                 check_res = check_triplet(*query)
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
@@ -830,6 +845,8 @@ def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], u
             try:
                 label = find_label(*query)
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
@@ -839,6 +856,8 @@ def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], u
             try:
                 types = find_types(query)
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
@@ -855,17 +874,11 @@ def execute_queries_list(parser_info_list: List[str], queries_list: List[Any], u
                     [triplet for triplet in triplets_backw if not triplet[0].startswith(prefixes["statement"])]
                 )
             except Exception as e:
+                if raise_errors:
+                    raise
                 log.info("Wrong arguments are passed to wiki_parser")
                 sentry_sdk.capture_exception(e)
                 log.exception(e)
             wiki_parser_output.append(list(triplets))
         else:
             raise ValueError(f"Unsupported query type {parser_info}")
-
-
-def wp_call(parser_info_list: List[str], queries_list: List[Any], utt_num: int) -> List[Any]:
-    wiki_parser_output = manager.list()
-    p = mp.Process(target=execute_queries_list, args=(parser_info_list, queries_list, utt_num, wiki_parser_output))
-    p.start()
-    p.join()
-    return list(wiki_parser_output)
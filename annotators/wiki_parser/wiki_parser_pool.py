@@ -0,0 +1,168 @@
+"""Worker pool and query cache of the wiki_parser server.
+
+The server imports only this module; the HDT document and the wikidata data of the wiki_parser module are loaded
+by the forkserver of the workers.
+"""
+import json
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+from typing import Any, Dict, List, Tuple
+
+import sentry_sdk
+
+from query_cache import QueryCache
+
+logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+NUM_WORKERS = int(os.getenv("WIKI_PARSER_WORKERS", 4))
+MAX_QUEUED_REQUESTS = int(os.getenv("WIKI_PARSER_QUEUE_SIZE", 32))
+QUERY_TIMEOUT = float(os.getenv("WIKI_PARSER_TIMEOUT", 5.0))
+CACHE_SIZE = int(os.getenv("WIKI_PARSER_CACHE_SIZE", 20000))
+CACHE_TTL = float(os.getenv("WIKI_PARSER_CACHE_TTL", 86400))
+WIKIDATA_CACHE_PATH = "/root/.deeppavlov/downloads/wikidata/wikidata_cache.json"
+
+
+def worker_loop(conn):
+    # the forkserver has preloaded the module, so the worker shares its HDT document and data
+    from wiki_parser import execute_queries_list
+
+    while True:
+        try:
+            parser_info_list, queries_list, utt_num = conn.recv()
+        except EOFError:
+            break
+        for parser_info, query in zip(parser_info_list, queries_list):
+            query_output = []
+            try:
+                execute_queries_list([parser_info], [query], utt_num, query_output, raise_errors=True)
+            except Exception as e:
+                log.info("Wrong arguments are passed to wiki_parser")
+                sentry_sdk.capture_exception(e)
+                log.exception(e)
+                # None marks the failed query, so that its empty answer is not cached
+                query_output = None
+            # every query is answered as soon as it is done, so that the pool can time out each of them
+            conn.send(query_output)
+
+
+class WikiParserPool:
+    """Pre-forked workers sharing the memory-mapped HDT document.
+
+    Every request is served by an idle worker over a plain pipe. Requests that do not find a free worker wait
+    in a bounded queue. Each query of a request has its own timeout: a worker which exceeds it is killed and
+    replaced by a fresh one, and the queries which did not finish are answered with the None error marker.
+
+    Workers are forked by a single-threaded forkserver which has the wiki_parser module preloaded, so replacements
+    started from a request-handling thread never inherit locks held by other threads of the server process, and
+    the HDT document and the wikidata data are loaded once, in the forkserver, rather than in the server too.
+    """
+
+    def __init__(self, num_workers: int, max_queued_requests: int, timeout: float):
+        self.ctx = mp.get_context("forkserver")
+        self.ctx.set_forkserver_preload(["wiki_parser"])
+        self.timeout = timeout
+        self.idle_workers = queue.Queue()
+        self.slots = threading.BoundedSemaphore(num_workers + max_queued_requests)
+        for _ in range(num_workers):
+            self.idle_workers.put(self.start_worker())
+
+    def start_worker(self) -> Tuple[mp.Process, Any]:
+        parent_conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(target=worker_loop, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    @staticmethod
+    def stop_worker(process: mp.Process, conn) -> None:
+        process.kill()
+        process.join()
+        conn.close()
+
+    def restart_worker(self, process: mp.Process, conn) -> Tuple[mp.Process, Any]:
+        log.warning(f"Restarting wiki_parser worker {process.pid}")
+        self.stop_worker(process, conn)
+        return self.start_worker()
+
+    def __call__(self, parser_info_list: List[str], queries_list: List[Any], utt_num: int) -> List[Any]:
+        if not self.slots.acquire(blocking=False):
+            raise RuntimeError("wiki_parser request queue is full")
+        try:
+            try:
+                process, conn = self.idle_workers.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f"no free wiki_parser worker in {self.timeout}s")
+            wiki_parser_output = []
+            try:
+                conn.send((parser_info_list, queries_list, utt_num))
+                for _ in queries_list:
+                    if not conn.poll(self.timeout):
+                        raise TimeoutError(f"wiki_parser query was not executed in {self.timeout}s")
+                    wiki_parser_output.append(conn.recv())
+            except TimeoutError as e:
+                log.warning(f"{e}, {len(wiki_parser_output)} of {len(queries_list)} queries are done")
+                process, conn = self.restart_worker(process, conn)
+            except BaseException:
+                process, conn = self.restart_worker(process, conn)
+                raise
+            finally:
+                self.idle_workers.put((process, conn))
+        finally:
+            self.slots.release()
+        return wiki_parser_output + [None] * (len(queries_list) - len(wiki_parser_output))
+
+
+wp_pool = None
+query_cache = QueryCache(CACHE_SIZE, CACHE_TTL)
+
+
+def wp_call(parser_info_list: List[str], queries_list: List[Any], utt_num: int) -> List[Any]:
+    keys = [QueryCache.make_key(parser_info, query) for parser_info, query in zip(parser_info_list, queries_list)]
+    queries_outputs = [query_cache.get(key) for key in keys]
+    missed_nums = [n for n, query_output in enumerate(queries_outputs) if query_output is None]
+    if missed_nums:
+        missed_outputs = wp_pool(
+            [parser_info_list[n] for n in missed_nums], [queries_list[n] for n in missed_nums], utt_num
+        )
+        for n, query_output in zip(missed_nums, missed_outputs):
+            if query_output is None:
+                query_output = []
+            else:
+                query_cache.put(keys[n], query_output)
+            queries_outputs[n] = query_output
+
+    wiki_parser_output = []
+    for parser_info, query_output in zip(parser_info_list, queries_outputs):
+        if parser_info == "find_top_triplets":
+            query_output = [{**entities_info, "utt_num": utt_num} for entities_info in query_output]
+        wiki_parser_output += query_output
+    return wiki_parser_output
+
+
+def warm_up_cache(warm_up_queries: List[Dict[str, Any]]) -> None:
+    for warm_up_query in warm_up_queries:
+        try:
+            wp_call([warm_up_query["parser_info"]], [warm_up_query["query"]], 0)
+        except Exception as e:
+            log.exception(e)
+    log.info(f"wiki_parser cache is warmed up: {query_cache.stats()}")
+
+
+def load_warm_up_queries() -> List[Dict[str, Any]]:
+    if not os.path.exists(WIKIDATA_CACHE_PATH):
+        return []
+    with open(WIKIDATA_CACHE_PATH, "r") as fl:
+        return json.load(fl).get("warm_up_queries", [])
+
+
+def start_wp_pool() -> None:
+    """Starts the workers and the cache warm-up in the server process."""
+    global wp_pool
+    wp_pool = WikiParserPool(NUM_WORKERS, MAX_QUEUED_REQUESTS, QUERY_TIMEOUT)
+    warm_up_queries = load_warm_up_queries()
+    if warm_up_queries:
+        threading.Thread(target=warm_up_cache, args=(warm_up_queries,), daemon=True).start()
@@ -0,0 +1,146 @@
+import asyncio
+import collections
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFullError(Exception):
+    pass
+
+
+class BatchingInferenceExecutor:
+    """Runs blocking batch inference of an async web service in a bounded thread pool.
+
+    Items of the concurrent requests are queued and merged into batches of up to `max_batch_size` items,
+    `batch_fn` gets a list of items and returns a list of results of the same length. At most `num_workers`
+    batches are processed at once, so the requests arriving during inference form the next batch.
+    A request is rejected with InferenceQueueFullError if there are already `max_queue_size` items in the queue.
+    Executors of endpoints which share one model should share `thread_pool` too, then the model runs at most
+    as many batches at once as the pool has threads. The executor must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 0.0,
+        max_queue_size: int = 256,
+        num_workers: int = 1,
+        thread_pool: Optional[ThreadPoolExecutor] = None,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.num_workers = num_workers
+        self.executor = thread_pool or ThreadPoolExecutor(max_workers=num_workers)
+        self.queue = collections.deque()
+        self.queued_items = 0
+        self.batches_in_flight = 0
+        self.processed_batches = 0
+        self.processed_items = 0
+        self.rejected_requests = 0
+        self.failed_batches = 0
+        self.inference_time = 0.0
+        # asyncio primitives are created in the event loop of the service
+        self._workers = None
+        self._wakeup = None
+        self._dispatcher = None
+
+    async def submit(self, items: List[Any]) -> List[Any]:
+        if not items:
+            return []
+        if self.queued_items and self.queued_items + len(items) > self.max_queue_size:
+            self.rejected_requests += 1
+            raise InferenceQueueFullError(f"{self.queued_items} items are already waiting for inference")
+        if self._dispatcher is None:
+            self._workers = asyncio.Semaphore(self.num_workers)
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        future = asyncio.get_event_loop().create_future()
+        self.queue.append((items, future))
+        self.queued_items += len(items)
+        self._wakeup.set()
+        return await future
+
+    async def _dispatch(self):
+        while True:
+            if not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._workers.acquire()
+            if self.max_wait and self.queued_items < self.max_batch_size:
+                await asyncio.sleep(self.max_wait)
+
+            items, requests = [], []
+            while self.queue and (not items or len(items) + len(self.queue[0][0]) <= self.max_batch_size):
+                request_items, future = self.queue.popleft()
+                self.queued_items -= len(request_items)
+                if future.done():
+                    # the client has gone away
+                    continue
+                items.extend(request_items)
+                requests.append((len(request_items), future))
+            if items:
+                asyncio.ensure_future(self._run_batch(items, requests))
+            else:
+                self._workers.release()
+
+    async def _run_batch(self, items: List[Any], requests: List):
+        self.batches_in_flight += 1
+        start_time = time.time()
+        loop = asyncio.get_event_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+        except Exception as exc:
+            self.failed_batches += 1
+            if len(requests) == 1:
+                if not requests[0][1].done():
+                    requests[0][1].set_exception(exc)
+            else:
+                # run the requests separately so that a single bad request does not fail the others
+                logger.warning(f"Batch of {len(requests)} requests failed, running them separately: {exc}")
+                offset = 0
+                for request_size, future in requests:
+                    request_items = items[offset : offset + request_size]
+                    offset += request_size
+                    try:
+                        request_results = await loop.run_in_executor(self.executor, self.batch_fn, request_items)
+                    except Exception as request_exc:
+                        if not future.done():
+                            future.set_exception(request_exc)
+                    else:
+                        if not future.done():
+                            future.set_result(request_results)
+        else:
+            offset = 0
+            for request_size, future in requests:
+                if not future.done():
+                    future.set_result(results[offset : offset + request_size])
+                offset += request_size
+        finally:
+            self.inference_time += time.time() - start_time
+            self.processed_batches += 1
+            self.processed_items += len(items)
+            self.batches_in_flight -= 1
+            self._workers.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queued_items,
+            "queued_requests": len(self.queue),
+            "max_queue_size": self.max_queue_size,
+            "batches_in_flight": self.batches_in_flight,
+            "processed_batches": self.processed_batches,
+            "processed_items": self.processed_items,
+            "failed_batches": self.failed_batches,
+            "rejected_requests": self.rejected_requests,
+            "mean_batch_size": self.processed_items / self.processed_batches if self.processed_batches else 0.0,
+            "mean_batch_time": self.inference_time / self.processed_batches if self.processed_batches else 0.0,
+        }
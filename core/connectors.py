@@ -9,6 +9,17 @@ import aiohttp
 import sentry_sdk
 from sentry_sdk.integrations.aiohttp import AioHttpIntegration
 
+from core.http_client import (  # noqa: F401
+    AdaptiveBatchingHTTPConnector,
+    AdaptiveQueueListenerBatchifyer,
+    QueueListenerBatchifyer,
+    close_client_session,
+    get_client_session,
+    get_pool_metrics,
+    is_pool_saturated,
+    make_queue_batchifyer,
+    track_request,
+)
 from core.transport.base import ServiceGatewayConnectorBase
 
 signal(SIGPIPE, SIG_DFL)
@@ -42,39 +53,6 @@ class AioQueueConnector:
         await self.queue.put(payload)
 
 
-class QueueListenerBatchifyer:
-    def __init__(self, session, url, queue, batch_size):
-        self.session = session
-        self.url = url
-        self.queue = queue
-        self.batch_size = batch_size
-
-    async def call_service(self, process_callable):
-        while True:
-            batch = []
-            rest = self.queue.qsize()
-            for _ in range(min(self.batch_size, rest)):
-                item = await self.queue.get()
-                batch.append(item)
-            if batch:
-                model_payload = self.glue_tasks(batch)
-                async with self.session.post(self.url, json=model_payload) as resp:
-                    response = await resp.json()
-                for task, task_response in zip(batch, response):
-                    asyncio.create_task(process_callable(task_id=task["task_id"], response=task_response))
-            await asyncio.sleep(0.1)
-
-    def glue_tasks(self, batch):
-        if len(batch) == 1:
-            return batch[0]["payload"]
-        else:
-            result = {k: [] for k in batch[0]["payload"].keys()}
-            for el in batch:
-                for k in result.keys():
-                    result[k].extend(el["payload"][k])
-            return result
-
-
 class ConfidenceResponseSelectorConnector:
     async def send(self, payload: Dict, callback: Callable):
         response = payload["payload"]["hypotheses"]
@@ -117,17 +95,25 @@ class ServiceGatewayHTTPConnector(ServiceGatewayConnectorBase):
 
     def __init__(self, service_config: Dict) -> None:
         super().__init__(service_config)
-        self._session = aiohttp.ClientSession()
+        self._session = get_client_session()
         self._service_name = service_config["name"]
         self._url = service_config["url"]
+        self._timeout = aiohttp.ClientTimeout(
+            total=service_config.get("timeout"), connect=service_config.get("connect_timeout")
+        )
 
     async def send_to_service(self, payloads: List[Dict]) -> List[Any]:
         batch = defaultdict(list)
         for payload in payloads:
             for key, value in payload.items():
                 batch[key].extend(value)
-        async with await self._session.post(self._url, json=batch) as resp:
-            responses_batch = await resp.json()
+        if self._session.closed:
+            self._session = get_client_session()
+        with track_request(self._url):
+            if is_pool_saturated(self._url):
+                logger.warning(f"HTTP connection pool is saturated: {get_pool_metrics()}")
+            async with self._session.post(self._url, json=batch, timeout=self._timeout) as resp:
+                responses_batch = await resp.json()
 
         return responses_batch
 
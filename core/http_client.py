@@ -0,0 +1,221 @@
+"""Shared aiohttp session of the agent and the batching http connectors.
+
+Kept apart from core.connectors, which needs the agent transport, so that pipeline configs can reference
+the connectors here as "core.http_client:<class name>".
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from os import getenv
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECTIONS_LIMIT = int(getenv("HTTP_CONNECTIONS_LIMIT", 1000))
+HTTP_CONNECTIONS_LIMIT_PER_HOST = int(getenv("HTTP_CONNECTIONS_LIMIT_PER_HOST", 32))
+HTTP_KEEPALIVE_TIMEOUT = float(getenv("HTTP_KEEPALIVE_TIMEOUT", 60))
+HTTP_DNS_CACHE_TTL = int(getenv("HTTP_DNS_CACHE_TTL", 300))
+
+_client_session: Optional[aiohttp.ClientSession] = None
+# requests of ServiceGatewayHTTPConnector which hold a connection of the shared session
+_requests_in_flight = 0
+_requests_in_flight_per_url: Dict[str, int] = defaultdict(int)
+
+
+def get_client_session() -> aiohttp.ClientSession:
+    """Returns the process-wide session, so that all services share one pool of keep-alive connections."""
+    global _client_session
+    if _client_session is None or _client_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTIONS_LIMIT,
+            limit_per_host=HTTP_CONNECTIONS_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+        _client_session = aiohttp.ClientSession(connector=connector)
+    return _client_session
+
+
+async def close_client_session() -> None:
+    global _client_session
+    if _client_session is not None and not _client_session.closed:
+        await _client_session.close()
+    _client_session = None
+
+
+@contextmanager
+def track_request(url: str):
+    """Counts the request to `url` as in flight on the shared session while the block runs."""
+    global _requests_in_flight
+    _requests_in_flight += 1
+    _requests_in_flight_per_url[url] += 1
+    try:
+        yield
+    finally:
+        _requests_in_flight -= 1
+        _requests_in_flight_per_url[url] -= 1
+
+
+def is_pool_saturated(url: str) -> bool:
+    """Whether the requests in flight use 90% of the pool or of the pool of `url`; a limit of 0 means no limit."""
+    if HTTP_CONNECTIONS_LIMIT and _requests_in_flight >= 0.9 * HTTP_CONNECTIONS_LIMIT:
+        return True
+    return bool(HTTP_CONNECTIONS_LIMIT_PER_HOST) and (
+        _requests_in_flight_per_url[url] >= 0.9 * HTTP_CONNECTIONS_LIMIT_PER_HOST
+    )
+
+
+def get_pool_metrics() -> Dict[str, Any]:
+    """Connection pool saturation of the shared session: the number of requests in flight and the pool limits."""
+    if _client_session is None or _client_session.closed:
+        return {}
+    connector = _client_session.connector
+    limit = getattr(connector, "limit", HTTP_CONNECTIONS_LIMIT)
+    return {
+        "in_flight": _requests_in_flight,
+        "limit": limit,
+        "limit_per_host": getattr(connector, "limit_per_host", HTTP_CONNECTIONS_LIMIT_PER_HOST),
+        "saturation": _requests_in_flight / limit if limit else 0.0,
+        "in_flight_per_url": {url: count for url, count in _requests_in_flight_per_url.items() if count},
+    }
+
+
+class QueueListenerBatchifyer:
+    def __init__(self, session, url, queue, batch_size):
+        self.session = session
+        self.url = url
+        self.queue = queue
+        self.batch_size = batch_size
+
+    async def call_service(self, process_callable):
+        while True:
+            batch = []
+            rest = self.queue.qsize()
+            for _ in range(min(self.batch_size, rest)):
+                item = await self.queue.get()
+                batch.append(item)
+            if batch:
+                model_payload = self.glue_tasks(batch)
+                async with self.session.post(self.url, json=model_payload) as resp:
+                    response = await resp.json()
+                for task, task_response in zip(batch, response):
+                    asyncio.create_task(process_callable(task_id=task["task_id"], response=task_response))
+            await asyncio.sleep(0.1)
+
+    def glue_tasks(self, batch):
+        if len(batch) == 1:
+            return batch[0]["payload"]
+        else:
+            result = {k: [] for k in batch[0]["payload"].keys()}
+            for el in batch:
+                for k in result.keys():
+                    result[k].extend(el["payload"][k])
+            return result
+
+
+class AdaptiveQueueListenerBatchifyer(QueueListenerBatchifyer):
+    """Event-driven batching: a batch is flushed as soon as it has `batch_size` tasks or when `max_wait_ms`
+    have passed since its first task. Several batches may be in flight at once, and a failed batch is split
+    in halves and retried, so one bad task does not fail its neighbors. Tasks of a batch which exceeds
+    `task_timeout` seconds fail with the timeout error.
+    """
+
+    def __init__(self, session, url, queue, batch_size, max_wait_ms=20, max_batches_in_flight=4, task_timeout=None):
+        super().__init__(session, url, queue, batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_batches_in_flight = max_batches_in_flight
+        self.task_timeout = task_timeout
+
+    async def call_service(self, process_callable):
+        loop = asyncio.get_event_loop()
+        batches_in_flight = asyncio.Semaphore(self.max_batches_in_flight)
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await batches_in_flight.acquire()
+            batch_task = asyncio.create_task(self.process_batch(batch, process_callable))
+            batch_task.add_done_callback(lambda _: batches_in_flight.release())
+
+    async def post_batch(self, batch):
+        async with self.session.post(self.url, json=self.glue_tasks(batch)) as resp:
+            resp.raise_for_status()
+            response = await resp.json()
+        if len(response) != len(batch):
+            raise ValueError(f"Got {len(response)} responses for {len(batch)} tasks from {self.url}")
+        return response
+
+    async def process_batch(self, batch, process_callable):
+        try:
+            response = await asyncio.wait_for(self.post_batch(batch), self.task_timeout)
+        except Exception as e:
+            if len(batch) > 1 and not isinstance(e, asyncio.TimeoutError):
+                middle = len(batch) // 2
+                logger.warning(f"Batch of {len(batch)} tasks to {self.url} failed, splitting it: {repr(e)}")
+                await asyncio.gather(
+                    self.process_batch(batch[:middle], process_callable),
+                    self.process_batch(batch[middle:], process_callable),
+                )
+            else:
+                for task in batch:
+                    asyncio.create_task(process_callable(task_id=task["task_id"], response=e))
+            return
+        for task, task_response in zip(batch, response):
+            asyncio.create_task(process_callable(task_id=task["task_id"], response=task_response))
+
+
+def make_queue_batchifyer(session, url, queue, config: Dict) -> QueueListenerBatchifyer:
+    """Builds the listener of the tasks queue of a batching connector config.
+
+    `"adaptive_batching": true` picks the event-driven AdaptiveQueueListenerBatchifyer configured with
+    `max_wait_ms`, `max_batches_in_flight` and `timeout`, otherwise the polling QueueListenerBatchifyer is used.
+    """
+    if config.get("adaptive_batching"):
+        return AdaptiveQueueListenerBatchifyer(
+            session,
+            url,
+            queue,
+            config["batch_size"],
+            max_wait_ms=config.get("max_wait_ms", 20),
+            max_batches_in_flight=config.get("max_batches_in_flight", 4),
+            task_timeout=config.get("timeout"),
+        )
+    return QueueListenerBatchifyer(session, url, queue, config["batch_size"])
+
+
+class AdaptiveBatchingHTTPConnector:
+    """Sends the tasks to the http service in batches made by AdaptiveQueueListenerBatchifyer.
+
+    The agent builds python connectors from the pipeline config with the config fields as arguments, e.g.
+    {"protocol": "python", "class_name": "core.http_client:AdaptiveBatchingHTTPConnector",
+    "url": "http://sentseg:8011/sentseg", "batch_size": 8, "max_wait_ms": 20}. The queue listeners (one per url)
+    are started on the first task, when the event loop of the agent is running.
+    """
+
+    def __init__(self, url: Optional[str] = None, urls: Optional[List[str]] = None, batch_size: int = 1, **config):
+        self.urls = urls or [url]
+        self.config = {"adaptive_batching": True, **config, "batch_size": batch_size}
+        self.queue = None
+        self.workers = []
+        self.worker_tasks = []
+
+    async def send(self, payload: Dict, callback: Callable):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            session = get_client_session()
+            self.workers = [make_queue_batchifyer(session, url, self.queue, self.config) for url in self.urls]
+            self.worker_tasks = [asyncio.create_task(worker.call_service(callback)) for worker in self.workers]
+        await self.queue.put(payload)
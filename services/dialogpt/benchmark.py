@@ -0,0 +1,66 @@
+import argparse
+import time
+
+import torch
+
+from server import encode_context, generate_batch, generate_responses, model, tokenizer
+
+CONTEXTS = [
+    ["hi", "hi. how are you?"],
+    ["let's chat about movies", "cool. what movies do you like?"],
+    ["i have a dog", "what is the name of your dog?", "his name is rex"],
+    ["what do you do for a living?"],
+    ["i like to travel", "where have you been?", "i have been to italy and spain last year"],
+    ["do you like music?", "yes, i listen to jazz a lot"],
+    ["what is your favorite food?", "pizza, and yours?", "i like sushi"],
+    ["i am so tired today"],
+]
+
+
+def count_tokens(output_ids):
+    # rows which finished early are padded with eos
+    num_tokens = 0
+    for row_ids in output_ids:
+        if tokenizer.eos_token_id in row_ids:
+            num_tokens += row_ids.index(tokenizer.eos_token_id) + 1
+        else:
+            num_tokens += len(row_ids)
+    return num_tokens
+
+
+def benchmark(batch_sizes, num_batches, do_sample):
+    for batch_size in batch_sizes:
+        batch_input_ids = [encode_context(CONTEXTS[i % len(CONTEXTS)], tokenizer) for i in range(batch_size)]
+        generate_batch(batch_input_ids, model, tokenizer, do_sample)  # warm up
+        num_tokens, total_time = 0, 0.0
+        for _ in range(num_batches):
+            st_time = time.time()
+            output_ids = generate_batch(batch_input_ids, model, tokenizer, do_sample)
+            total_time += time.time() - st_time
+            num_tokens += count_tokens(output_ids)
+        print(
+            f"batch size {batch_size:2d}: {num_tokens / total_time:8.1f} tokens/s, "
+            f"{total_time / num_batches:.3f}s per batch"
+        )
+
+
+def check_greedy_outputs():
+    single_responses = [generate_responses([context], model, tokenizer, do_sample=False)[0] for context in CONTEXTS]
+    batch_responses = generate_responses(CONTEXTS, model, tokenizer, batch_size=len(CONTEXTS), do_sample=False)
+    mismatches = [(s, b) for s, b in zip(single_responses, batch_responses) if s != b]
+    print(f"greedy batched responses match the unbatched ones for {len(CONTEXTS) - len(mismatches)}/{len(CONTEXTS)}")
+    for single_response, batch_response in mismatches:
+        print(f"  unbatched: {single_response!r}\n  batched:   {batch_response!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tokens/s of DialoGPT generation for different batch sizes")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--num_batches", type=int, default=5)
+    parser.add_argument("--greedy", action="store_true", help="use greedy decoding instead of top-k sampling")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    check_greedy_outputs()
+    benchmark(args.batch_sizes, args.num_batches, not args.greedy)
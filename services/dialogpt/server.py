@@ -7,6 +7,7 @@ import torch
 from flask import Flask, request, jsonify
 from sentry_sdk.integrations.flask import FlaskIntegration
 from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers.modeling_utils import Conv1D
 
 sentry_sdk.init(dsn=os.getenv("SENTRY_DSN"), integrations=[FlaskIntegration()])
 
@@ -19,13 +20,38 @@ logging.info(f"PRETRAINED_MODEL_NAME_OR_PATH = {PRETRAINED_MODEL_NAME_OR_PATH}")
 DEFAULT_CONFIDENCE = 0.9
 ZERO_CONFIDENCE = 0.0
 MAX_HISTORY_DEPTH = 3
+MAX_LENGTH = 50
+TOP_K = 3
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 16))
+DO_SAMPLE = int(os.environ.get("DO_SAMPLE", 1))
+QUANTIZE = int(os.environ.get("QUANTIZE", 0))
+logging.info(f"BATCH_SIZE = {BATCH_SIZE}, DO_SAMPLE = {DO_SAMPLE}, QUANTIZE = {QUANTIZE}")
+
+
+def conv1d_to_linear(module):
+    """Replace GPT-2 Conv1D layers with the equivalent nn.Linear ones, dynamic quantization handles only the latter."""
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            nx, nf = child.weight.shape
+            linear = torch.nn.Linear(nx, nf)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            conv1d_to_linear(child)
+    return module
+
 
 try:
     tokenizer = AutoTokenizer.from_pretrained(PRETRAINED_MODEL_NAME_OR_PATH)
     model = AutoModelForCausalLM.from_pretrained(PRETRAINED_MODEL_NAME_OR_PATH)
+    model.eval()
     if torch.cuda.is_available():
         model.to("cuda")
         logger.info("dialogpt is set to run on cuda")
+    elif QUANTIZE:
+        model = torch.quantization.quantize_dynamic(conv1d_to_linear(model), {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info("dialogpt is quantized to int8")
 
     logger.info("dialogpt is ready")
 except Exception as e:
@@ -37,21 +63,66 @@ app = Flask(__name__)
 logging.getLogger("werkzeug").setLevel("WARNING")
 
 
-def generate_response(context, model, tokenizer):
-    encoded_context = []
+def encode_context(context, tokenizer):
+    input_ids = []
     for uttr in context[-MAX_HISTORY_DEPTH:]:
-        encoded_context += [tokenizer.encode(uttr + tokenizer.eos_token, return_tensors="pt")]
-    bot_input_ids = torch.cat(encoded_context, dim=-1)
+        input_ids += tokenizer.encode(uttr + tokenizer.eos_token)
+    return input_ids
+
+
+def generate_batch(batch_input_ids, model, tokenizer, do_sample=DO_SAMPLE):
+    """Generate continuations of the contexts with one `generate` call.
+
+    Contexts are left-padded, so that the generated tokens of all rows start at the same position.
+    Every row may generate up to MAX_LENGTH tokens including its own context as in the unbatched generation,
+    the rows which finished with eos are padded by `generate` until the longest one is done.
+    """
+    pad_token_id = tokenizer.eos_token_id
+    padded_length = max(len(input_ids) for input_ids in batch_input_ids)
+    input_ids = torch.full((len(batch_input_ids), padded_length), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(batch_input_ids), padded_length), dtype=torch.long)
+    for i, row_input_ids in enumerate(batch_input_ids):
+        input_ids[i, padded_length - len(row_input_ids) :] = torch.tensor(row_input_ids, dtype=torch.long)
+        attention_mask[i, padded_length - len(row_input_ids) :] = 1
+    max_new_tokens = [MAX_LENGTH - len(row_input_ids) for row_input_ids in batch_input_ids]
 
     with torch.no_grad():
         if torch.cuda.is_available():
-            bot_input_ids = bot_input_ids.to("cuda")
+            input_ids = input_ids.to("cuda")
+            attention_mask = attention_mask.to("cuda")
         chat_history_ids = model.generate(
-            bot_input_ids, do_sample=True, max_length=50, top_k=3, pad_token_id=tokenizer.eos_token_id
+            input_ids,
+            attention_mask=attention_mask,
+            do_sample=bool(do_sample),
+            max_length=padded_length + max(max_new_tokens),
+            top_k=TOP_K,
+            pad_token_id=pad_token_id,
         )
         if torch.cuda.is_available():
             chat_history_ids = chat_history_ids.cpu()
-    return tokenizer.decode(chat_history_ids[:, bot_input_ids.shape[-1] :][0], skip_special_tokens=True)
+    return [
+        row_ids[padded_length : padded_length + row_max_new_tokens].tolist()
+        for row_ids, row_max_new_tokens in zip(chat_history_ids, max_new_tokens)
+    ]
+
+
+def generate_responses(contexts, model, tokenizer, batch_size=BATCH_SIZE, do_sample=DO_SAMPLE):
+    encoded_contexts = [encode_context(context, tokenizer) for context in contexts]
+    # contexts longer than MAX_LENGTH leave no room for the response
+    indices = [i for i, input_ids in enumerate(encoded_contexts) if 0 < len(input_ids) < MAX_LENGTH]
+    # contexts of similar length are batched together to reduce padding
+    indices = sorted(indices, key=lambda i: len(encoded_contexts[i]))
+    responses = [""] * len(contexts)
+    for start in range(0, len(indices), batch_size):
+        batch_indices = indices[start : start + batch_size]
+        batch_output_ids = generate_batch([encoded_contexts[i] for i in batch_indices], model, tokenizer, do_sample)
+        for i, output_ids in zip(batch_indices, batch_output_ids):
+            responses[i] = tokenizer.decode(output_ids, skip_special_tokens=True)
+    return responses
+
+
+def generate_response(context, model, tokenizer):
+    return generate_responses([context], model, tokenizer)[0]
 
 
 @app.route("/respond", methods=["POST"])
@@ -62,8 +133,7 @@ def respond():
     try:
         responses = []
         confidences = []
-        for context in contexts:
-            response = generate_response(context, model, tokenizer)
+        for response in generate_responses(contexts, model, tokenizer):
             if len(response) > 3:
                 # drop too short responses
                 responses += [response]
@@ -78,5 +148,5 @@ def respond():
         confidences = [ZERO_CONFIDENCE] * len(contexts)
 
     total_time = time.time() - st_time
-    logger.info(f"masked_lm exec time: {total_time:.3f}s")
+    logger.info(f"dialogpt exec time: {total_time:.3f}s")
     return jsonify(list(zip(responses, confidences)))
@@ -18,6 +18,7 @@ logger = logging.getLogger(__name__)
 PRETRAINED_MODEL_NAME_OR_PATH = os.environ.get("PRETRAINED_MODEL_NAME_OR_PATH")
 logging.info(f"PRETRAINED_MODEL_NAME_OR_PATH = {PRETRAINED_MODEL_NAME_OR_PATH}")
 MASK_ID = 103
+TOPK = int(os.environ.get("TOPK", 10))
 try:
     cuda = torch.cuda.is_available()
     if cuda:
@@ -46,27 +47,64 @@ health = HealthCheck(app, "/healthcheck")
 logging.getLogger("werkzeug").setLevel("WARNING")
 
 
+def predict_masked_tokens(texts, topk=TOPK, candidates=None):
+    """Returns top-k tokens with probabilities for every masked token of the texts.
+
+    All distinct texts are encoded with one padded forward pass, the LM head is applied only to the masked tokens.
+    If `candidates` are given (a list of candidate tokens for every text), the probabilities of the candidates
+    in every masked slot are returned as well, so ranking of the candidates needs a single pass over the context.
+    Candidates which are not single tokens of the vocabulary get None.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    inputs = tokenizer(unique_texts, return_tensors="pt", padding=True)
+    inputs = {k: v.cuda() for k, v in inputs.items()} if cuda else inputs
+    masked = inputs["input_ids"] == MASK_ID
+    with torch.no_grad():
+        hidden_states = model.bert(**inputs)[0]
+        # logits of the masked tokens of all texts in order
+        logits = model.cls(hidden_states[masked]).cpu()
+    log_norms = torch.logsumexp(logits, dim=-1)
+    top_logits, top_ids = logits.topk(min(topk, logits.shape[-1]), dim=-1)
+    top_probs = torch.exp(top_logits - log_norms.unsqueeze(-1)).tolist()
+    top_ids = top_ids.tolist()
+
+    text_offsets = {}
+    offset = 0
+    for text, num_masked in zip(unique_texts, masked.sum(dim=1).tolist()):
+        text_offsets[text] = (offset, offset + num_masked)
+        offset += num_masked
+
+    batch_predicted_tokens = []
+    batch_candidate_probs = []
+    for i, text in enumerate(texts):
+        start, end = text_offsets[text]
+        predicted_tokens = []
+        for token_probs, token_ids in zip(top_probs[start:end], top_ids[start:end]):
+            tokens = [tokenizer.decode([token_id]) for token_id in token_ids]
+            predicted_tokens.append({token: prob for token, prob in zip(tokens, token_probs)})
+        batch_predicted_tokens.append(predicted_tokens)
+        if candidates is not None:
+            candidate_ids = [tokenizer.vocab.get(candidate) for candidate in candidates[i]]
+            candidate_probs = []
+            for slot in range(start, end):
+                slot_probs = {}
+                for candidate, token_id in zip(candidates[i], candidate_ids):
+                    if token_id is None:
+                        slot_probs[candidate] = None
+                    else:
+                        slot_probs[candidate] = torch.exp(logits[slot, token_id] - log_norms[slot]).item()
+                candidate_probs.append(slot_probs)
+            batch_candidate_probs.append(candidate_probs)
+    return batch_predicted_tokens, batch_candidate_probs
+
+
 @app.route("/respond", methods=["POST"])
 def respond():
     st_time = time.time()
 
     text = request.json.get("text", [])
     try:
-        inputs = tokenizer(text, return_tensors="pt", padding=True)
-        inputs = {k: v.cuda() for k, v in inputs.items()} if cuda else inputs
-        logits = model(**inputs).logits.cpu()
-        probs = torch.nn.functional.softmax(logits, dim=2)
-
-        batch_predicted_tokens = []
-        for batch_i in range(probs.shape[0]):
-            masked_tokens = probs[batch_i][inputs["input_ids"][batch_i] == MASK_ID]
-            predicted_tokens = []
-            for token_id in range(masked_tokens.shape[0]):
-                token_probs, token_ids = masked_tokens[token_id].topk(10)
-                token_probs = token_probs.tolist()
-                token_ids = [tokenizer.decode([id]) for id in token_ids.tolist()]
-                predicted_tokens.append({token: prob for token, prob in zip(token_ids, token_probs)})
-            batch_predicted_tokens.append(predicted_tokens)
+        batch_predicted_tokens, _ = predict_masked_tokens(text) if text else ([], [])
     except Exception as exc:
         logger.exception(exc)
         sentry_sdk.capture_exception(exc)
@@ -75,3 +113,26 @@ def respond():
     total_time = time.time() - st_time
     logger.info(f"masked_lm exec time: {total_time:.3f}s")
     return jsonify({"predicted_tokens": batch_predicted_tokens})
+
+
+@app.route("/respond_batch", methods=["POST"])
+def respond_batch():
+    st_time = time.time()
+
+    text = request.json.get("text", [])
+    candidates = request.json.get("candidates")
+    topk = request.json.get("topk", TOPK)
+    try:
+        if text:
+            batch_predicted_tokens, batch_candidate_probs = predict_masked_tokens(text, topk, candidates)
+        else:
+            batch_predicted_tokens, batch_candidate_probs = [], []
+    except Exception as exc:
+        logger.exception(exc)
+        sentry_sdk.capture_exception(exc)
+        batch_predicted_tokens = [[]] * len(text)
+        batch_candidate_probs = [[]] * len(text) if candidates is not None else []
+
+    total_time = time.time() - st_time
+    logger.info(f"masked_lm batch exec time: {total_time:.3f}s")
+    return jsonify({"predicted_tokens": batch_predicted_tokens, "candidate_probs": batch_candidate_probs})
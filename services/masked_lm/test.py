@@ -55,6 +55,13 @@ def test_respond():
     result = round_struct(result, digits)
     gold_result = round_struct(gold_result, digits)
     assert result == gold_result, f"Got\n{result}\n, but expected:\n{gold_result}"
+
+    batch_url = "http://0.0.0.0:8088/respond_batch"
+    request_data = {"text": text * 2, "candidates": [["the", "a", "unknownword"]] * 2}
+    result = requests.post(batch_url, json=request_data).json()
+    assert round_struct(result["predicted_tokens"], digits) == gold_result["predicted_tokens"] * 2, f"Got\n{result}"
+    candidate_probs = result["candidate_probs"][0][0]
+    assert round(candidate_probs["the"], digits) == 0.69 and candidate_probs["unknownword"] is None, f"Got\n{result}"
     print("Success")
 
 
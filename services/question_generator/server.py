@@ -1,6 +1,7 @@
 import logging
 import time
 import os
+from collections import OrderedDict
 
 from utils import QGTokenizer
 
@@ -19,6 +20,9 @@ logger = logging.getLogger(__name__)
 MODEL_PATH = os.environ.get("MODEL_PATH", "/data/model.pth")
 BASE_MODEL = os.environ.get("BASE_MODEL", "t5-base")
 DECODING = os.environ.get("DECODING", "greedy")  # greedy, topk-N (e.g., topk-10)
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 16))
+MAX_SRC_LEN = int(os.environ.get("MAX_SRC_LEN", 200))  # token budget of the text with the answer
+CACHE_SIZE = int(os.environ.get("CACHE_SIZE", 10000))
 
 cuda = torch.cuda.is_available()
 if cuda:
@@ -33,7 +37,7 @@ logger.info(f"question generation is set to run on {device}")
 logger.info("question generation model is preparing...")
 config = T5Config.from_pretrained(BASE_MODEL)
 model = T5ForConditionalGeneration(config=config)
-t = QGTokenizer(tokenizer=BASE_MODEL)
+t = QGTokenizer(tokenizer=BASE_MODEL, max_src_len=MAX_SRC_LEN)
 checkpoint = torch.load(MODEL_PATH, map_location=device)
 model.load_state_dict(checkpoint["model_state_dict"])
 model.eval()
@@ -45,24 +49,72 @@ logger.info(f"question generation model is ready")
 app = Flask(__name__)
 
 
+questions_cache = OrderedDict()
+
+
+def normalize(text):
+    return " ".join(text.split())
+
+
+def generate_questions(samples):
+    input_ids = [t(sample)["input_ids"] for sample in samples]
+    max_len = max(len(sample_input_ids) for sample_input_ids in input_ids)
+    input_ids_t = torch.full((len(samples), max_len), t.tokenizer.pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(samples), max_len), dtype=torch.long)
+    for i, sample_input_ids in enumerate(input_ids):
+        input_ids_t[i, : len(sample_input_ids)] = torch.tensor(sample_input_ids, dtype=torch.long)
+        attention_mask[i, : len(sample_input_ids)] = 1
+    input_ids_t, attention_mask = input_ids_t.to(device), attention_mask.to(device)
+    with torch.no_grad():
+        if DECODING == "greedy":
+            questions = model.generate(input_ids_t, attention_mask=attention_mask, max_length=t.max_tgt_len)
+        elif "topk-" in DECODING:
+            k = int(DECODING.split("-")[1])
+            questions = model.generate(
+                input_ids_t, attention_mask=attention_mask, top_k=k, do_sample=True, max_length=t.max_tgt_len
+            )
+        else:
+            raise RuntimeError(f"Unknown decoding algo: {DECODING}")
+    results = []
+    for question in questions:
+        question = t.tokenizer.decode(question)
+        question = question.replace("<pad>", "").replace("question:", "").replace("</s>", "").strip()
+        results.append(question)
+    return results
+
+
+def get_questions(texts, answers):
+    keys = [(normalize(text), normalize(answer)) for text, answer in zip(texts, answers)]
+    questions = {}
+    for key in keys:
+        if key in questions_cache:
+            questions_cache.move_to_end(key)
+            questions[key] = questions_cache[key]
+    new_keys = list(dict.fromkeys(key for key in keys if key not in questions))
+    # samples of similar length are batched together to reduce padding
+    new_keys = sorted(new_keys, key=lambda key: len(key[0]) + len(key[1]))
+    for start in range(0, len(new_keys), BATCH_SIZE):
+        batch_keys = new_keys[start : start + BATCH_SIZE]
+        batch_questions = generate_questions([{"text": text, "answer": answer} for text, answer in batch_keys])
+        for key, question in zip(batch_keys, batch_questions):
+            questions[key] = question
+            questions_cache[key] = question
+    while len(questions_cache) > CACHE_SIZE:
+        questions_cache.popitem(last=False)
+    return [questions[key] for key in keys]
+
+
 @app.route("/question", methods=["POST"])
 def respond():
     st_time = time.time()
 
     text = request.json["text"]
     answer = request.json["answer"]
-    sample = {"text": text, "answer": answer}
-    input_ids = t(sample)["input_ids"]
-    input_ids_t = torch.tensor([input_ids]).to(device)
-    if DECODING == "greedy":
-        question = model.generate(input_ids_t, max_length=t.max_tgt_len)[0]
-    elif "topk-" in DECODING:
-        k = int(DECODING.split("-")[1])
-        question = model.generate(input_ids_t, top_k=k, do_sample=True, max_length=t.max_tgt_len)[0]
+    if isinstance(text, list):
+        # batch of samples
+        question = get_questions(text, answer)
     else:
-        raise RuntimeError(f"Unknown decoding algo: {DECODING}")
-    question = t.tokenizer.decode(question)
-    question = question.replace("<pad>", "").replace("question:", "").replace("</s>", "").strip()
+        question = get_questions([text], [answer])[0]
 
     logger.info(question)
     total_time = time.time() - st_time
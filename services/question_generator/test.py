@@ -18,6 +18,12 @@ def test_question_generator():
 
     gold_result = {"question": "What is Lipa's father's job?"}
 
+    assert result == gold_result, f"Got\n{result}\n, but expected:\n{gold_result}"
+
+    request_data = {"text": [text, text], "answer": [answer, answer]}
+    result = requests.post(url, json=request_data).json()
+    gold_result = {"question": [gold_result["question"]] * 2}
+
     assert result == gold_result, f"Got\n{result}\n, but expected:\n{gold_result}"
     print("Success")
 
@@ -12,8 +12,16 @@ class QGTokenizer:
             return ids[-truncate_len:]
         return ids[:truncate_len]
 
+    def _trim_text(self, text):
+        # only the last max_src_len tokens of the input are kept and every word is at least one token,
+        # so the words before the last max_src_len ones are dropped without tokenization
+        words = text.split()
+        if len(words) > self.max_src_len:
+            words = words[-self.max_src_len :]
+        return " ".join(words)
+
     def __call__(self, sample):
-        src = sample["text"] + " answer: " + sample["answer"]
+        src = self._trim_text(sample["text"]) + " answer: " + sample["answer"]
         src_tokenized = self.tokenizer(src, add_special_tokens=True)
         if "q" in sample:
             tgt = "question: " + sample["q"]
@@ -0,0 +1,64 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Merges items of concurrent requests into batches processed by a single worker thread.
+
+    `batch_fn` gets a list of items and returns a list of results of the same length. The worker takes the first
+    waiting request and collects the requests arriving within `max_wait_ms` while there are less than
+    `max_batch_size` items, so a single request is not delayed by more than `max_wait_ms`.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=5.0):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def __call__(self, items):
+        if not items:
+            return []
+        request = {"items": items, "done": threading.Event()}
+        self.queue.put(request)
+        request["done"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["results"]
+
+    def _collect(self):
+        requests = [self.queue.get()]
+        num_items = len(requests[0]["items"])
+        deadline = time.time() + self.max_wait
+        while num_items < self.max_batch_size:
+            try:
+                request = self.queue.get(timeout=max(deadline - time.time(), 0.0))
+            except queue.Empty:
+                break
+            requests.append(request)
+            num_items += len(request["items"])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            items = [item for request in requests for item in request["items"]]
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                logger.exception(e)
+                for request in requests:
+                    request["error"] = e
+                    request["done"].set()
+                continue
+            offset = 0
+            for request in requests:
+                request["results"] = results[offset : offset + len(request["items"])]
+                offset += len(request["items"])
+                request["done"].set()
@@ -1,16 +1,24 @@
 import logging
 import os
+import threading
 import time
+from collections import OrderedDict
 
 from flask import Flask, request, jsonify
 import sentry_sdk
 from sentry_sdk.integrations.flask import FlaskIntegration
 from deeppavlov import build_model
 
+from micro_batcher import MicroBatcher
+
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 sentry_sdk.init(dsn=os.getenv("SENTRY_DSN"), integrations=[FlaskIntegration()])
 
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 32))
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS", 5))
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", 10000))
+
 try:
     kgdg = build_model("kg_dial_generator.json", download=True)
     test_res = kgdg(["What is the capital of Russia?"], [["Q159"]])
@@ -23,6 +31,43 @@ except Exception as e:
 app = Flask(__name__)
 
 
+def generate(samples):
+    sentences = [sentence for sentence, _ in samples]
+    entities = [list(entities_list) for _, entities_list in samples]
+    generated_utterances, confidences = kgdg(sentences, entities)
+    return list(zip(generated_utterances, confidences))
+
+
+# samples of concurrent requests are generated with one call of the model
+batcher = MicroBatcher(generate, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS)
+# the triples to verbalize are found by the sentence and its entities, so the results are cached by them
+cache = OrderedDict()
+cache_lock = threading.Lock()
+
+
+def get_generated_utterances(sentences, entities):
+    samples = [
+        (" ".join(sentence.split()), tuple(entities_list)) for sentence, entities_list in zip(sentences, entities)
+    ]
+    results = {}
+    with cache_lock:
+        for sample in samples:
+            if sample in cache:
+                cache.move_to_end(sample)
+                results[sample] = cache[sample]
+    new_samples = list(dict.fromkeys(sample for sample in samples if sample not in results))
+    if new_samples:
+        new_results = batcher(new_samples)
+        results.update(zip(new_samples, new_results))
+        with cache_lock:
+            cache.update(zip(new_samples, new_results))
+            while len(cache) > CACHE_SIZE:
+                cache.popitem(last=False)
+    generated_utterances = [results[sample][0] for sample in samples]
+    confidences = [results[sample][1] for sample in samples]
+    return generated_utterances, confidences
+
+
 @app.route("/model", methods=["POST"])
 def respond():
     tm_st = time.time()
@@ -45,7 +90,7 @@ def respond():
             f_entities.append(entities_list)
 
     try:
-        generated_utterances, confidences = kgdg(f_sentences, f_entities)
+        generated_utterances, confidences = get_generated_utterances(f_sentences, f_entities)
         out_uttr = []
         out_conf = []
         cnt_fnd = 0
@@ -0,0 +1,60 @@
+import logging
+import argparse
+import pickle
+import pathlib
+
+import hnswlib
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(module)s %(lineno)d %(levelname)s : %(message)s",
+    handlers=[logging.StreamHandler()],
+)
+logger = logging.getLogger(__name__)
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--database_file_path",
+    type=pathlib.Path,
+    help="Path to a pickle file with encoded responses made by preencode_responses.py",
+    default="replies.pkl",
+)
+parser.add_argument(
+    "--index_file_path",
+    type=pathlib.Path,
+    help="Store HNSW index to the file",
+    default="replies_hnsw.bin",
+)
+parser.add_argument(
+    "--encodings_file_path",
+    type=pathlib.Path,
+    help="Store response encodings to the npy file of float16 which can be memory-mapped",
+    default="replies_encodings.npy",
+)
+parser.add_argument(
+    "--responses_file_path",
+    type=pathlib.Path,
+    help="Store responses to the pickle file",
+    default="replies_texts.pkl",
+)
+parser.add_argument("--ef_construction", type=int, default=200, help="Size of the candidates list at construction")
+parser.add_argument("--m", type=int, default=32, help="Number of bi-directional links of every element")
+parser.add_argument("--num_threads", type=int, default=-1, help="Number of threads, -1 uses all CPUs")
+
+args = parser.parse_args()
+
+response_encodings, responses = pickle.load(args.database_file_path.open("rb"))
+response_encodings = np.asarray(response_encodings, dtype=np.float32)
+num_responses, dim = response_encodings.shape
+logger.info(f"Loaded {num_responses} encoded responses of dim {dim}.")
+
+index = hnswlib.Index(space="ip", dim=dim)
+index.init_index(max_elements=num_responses, ef_construction=args.ef_construction, M=args.m)
+index.add_items(response_encodings, np.arange(num_responses), num_threads=args.num_threads)
+index.save_index(str(args.index_file_path))
+logger.info(f"Saved HNSW index to {args.index_file_path}.")
+
+np.save(str(args.encodings_file_path), response_encodings.astype(np.float16))
+pickle.dump(list(responses), args.responses_file_path.open("wb"))
+logger.info(f"Saved float16 encodings to {args.encodings_file_path} and responses to {args.responses_file_path}.")
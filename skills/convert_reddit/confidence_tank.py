@@ -51,4 +51,4 @@ for task in tqdm.tqdm(data["tasks"]):
         response[res[0]] = res[1]
     confidences.extend(response.values())
 
-np.save(str(args.npy_file_path), confidences)
+np.save(str(args.npy_file_path), np.sort(confidences))
@@ -86,4 +86,4 @@ for dialog in tqdm.tqdm(data):
     pickle.dump(similar_requests, args.cache_file_path.open("wb"))
 
 confidences = sum([list(set(set_conf)) for set_conf in similar_requests.values()], [])
-np.save(str(args.npy_file_path), confidences)
+np.save(str(args.npy_file_path), np.sort(confidences))
@@ -4,9 +4,10 @@ import random
 import pickle
 import time
 import json
-import difflib
 import traceback
 import re
+from collections import Counter
+from functools import lru_cache
 
 import tensorflow_hub as tfhub
 import tensorflow as tf
@@ -16,6 +17,8 @@ from flask import Flask, request, jsonify
 from flasgger import Swagger, swag_from
 import sentry_sdk
 
+from utils import clear_text, compile_phrases_pattern, is_similar, SimilarityFilter, top_k_dot_products
+
 tensorflow_text.__name__
 
 SENTRY_DSN = os.getenv("SENTRY_DSN")
@@ -26,6 +29,12 @@ CONFIDENCE_PATH = os.getenv("CONFIDENCE_PATH")
 SOFTMAX_TEMPERATURE = float(os.getenv("SOFTMAX_TEMPERATURE", 0.08))
 CONFIDENCE_DECAY = float(os.getenv("CONVERT_CONFIDENCE_DECAY", 0.9))
 NUM_SAMPLE = int(os.getenv("NUM_SAMPLE", 3))
+ENCODINGS_PATH = os.getenv("ENCODINGS_PATH")
+RESPONSES_PATH = os.getenv("RESPONSES_PATH")
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH")
+ANN_EF_SEARCH = int(os.getenv("ANN_EF_SEARCH", 100))
+DENSE_CHUNK_SIZE = int(os.getenv("DENSE_CHUNK_SIZE", 65536))
+TOP_K = 10
 
 
 sentry_sdk.init(SENTRY_DSN)
@@ -44,25 +53,40 @@ random.seed(SEED)
 sess = tf.InteractiveSession(graph=tf.Graph())
 
 module = tfhub.Module(MODEL_PATH)
-response_encodings, responses = pickle.load(open(DATABASE_PATH, "rb"))
-confidences = np.load(CONFIDENCE_PATH)
-
-
-spaces_pat = re.compile(r"\s+")
-special_symb_pat = re.compile(r"[^A-Za-z0-9 ]")
-
-
-def clear_text(text):
-    text = special_symb_pat.sub("", spaces_pat.sub(" ", text.lower().replace("\n", " "))).strip()
-    text = text.replace("\u2019", "'")
-    return text
+if ENCODINGS_PATH and RESPONSES_PATH:
+    # float16 encodings made by build_ann_index.py are shared between workers through the page cache
+    response_encodings = np.load(ENCODINGS_PATH, mmap_mode="r")
+    responses = pickle.load(open(RESPONSES_PATH, "rb"))
+else:
+    response_encodings, responses = pickle.load(open(DATABASE_PATH, "rb"))
+# calibration confidences are sorted to find the quantile of a score with a binary search
+confidences = np.sort(np.load(CONFIDENCE_PATH))
+
+if ANN_INDEX_PATH:
+    import hnswlib
+
+    ann_index = hnswlib.Index(space="ip", dim=response_encodings.shape[1])
+    ann_index.load_index(ANN_INDEX_PATH, max_elements=response_encodings.shape[0])
+    ann_index.set_ef(max(ANN_EF_SEARCH, TOP_K))
+    logger.info(f"Loaded ANN index from {ANN_INDEX_PATH}")
+else:
+    ann_index = None
 
 
 banned_responses = json.load(open("./banned_responses.json"))
 banned_responses = [clear_text(utter) for utter in banned_responses]
+banned_responses_filter = SimilarityFilter(banned_responses, threshold=0.9)
 banned_phrases = json.load(open("./banned_phrases.json"))
-banned_words = json.load(open("./banned_words.json"))
-banned_words_for_questions = json.load(open("./banned_words_for_questions.json"))
+banned_phrases_pattern = compile_phrases_pattern(banned_phrases)
+banned_words = set(json.load(open("./banned_words.json")))
+banned_words_for_questions = set(json.load(open("./banned_words_for_questions.json")))
+
+
+@lru_cache(maxsize=2 ** 16)
+def get_response_tokens(ind):
+    tokens = clear_text(responses[ind]).split()
+    return tokens, Counter(tokens)
+
 
 text_placeholder = tf.placeholder(dtype=tf.string, shape=[None])
 extra_text_placeholder = tf.placeholder(dtype=tf.string, shape=[None])
@@ -76,32 +100,50 @@ sess.run(tf.tables_initializer())
 sess.run(tf.global_variables_initializer())
 
 
-def encode_context(dialogue_history):
-    """Encode the dialogue context to the response ranking vector space.
+def encode_contexts(dialogue_histories):
+    """Encode the dialogue contexts to the response ranking vector space in one session run.
 
     Args:
-        dialogue_history: a list of strings, the dialogue history, in
-            chronological order.
+        dialogue_histories: a list of dialogue histories, each of them is a list of strings
+            in chronological order.
     """
 
     # The context is the most recent message in the history.
-    context = dialogue_history[-1]
-
-    extra_context = list(dialogue_history[:-1])
-    extra_context.reverse()
-    extra_context_feature = " ".join(extra_context)
+    contexts = [dialogue_history[-1] for dialogue_history in dialogue_histories]
+    extra_context_features = [" ".join(reversed(dialogue_history[:-1])) for dialogue_history in dialogue_histories]
 
     return sess.run(
         context_encoding_tensor,
-        feed_dict={text_placeholder: [context], extra_text_placeholder: [extra_context_feature]},
-    )[0]
+        feed_dict={text_placeholder: contexts, extra_text_placeholder: extra_context_features},
+    )
 
 
-def approximate_confidence(confidence, approximate_confidence_is_enabled=True):
+def find_top_responses(context_encodings, top_k=TOP_K):
+    """Find indices of the responses with the highest scores for every context encoding, sorted by descending
+    score, and their scores. Both are arrays of shape (number of contexts, top_k).
+
+    The ANN index is used if it is loaded, otherwise the exact scores of all responses are computed by chunks.
+    """
+    top_k = min(top_k, len(responses))
+    if ann_index is not None:
+        indices, _ = ann_index.knn_query(context_encodings, k=top_k)
+        indices = indices.astype(np.int64)
+        scores = np.einsum("nkd,nd->nk", response_encodings[indices].astype(np.float32), context_encodings)
+    else:
+        # the responses are scored by chunks, so the float16 memory-mapped encodings are not copied at once
+        indices, scores = top_k_dot_products(
+            context_encodings.astype(np.float32), response_encodings, top_k, DENSE_CHUNK_SIZE
+        )
+    order = np.argsort(scores, axis=1)[:, ::-1]
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def approximate_confidences(scores, approximate_confidence_is_enabled=True):
+    scores = np.asarray(scores)
     if approximate_confidence_is_enabled:
-        return 0.85 * (confidences <= confidence).sum() / len(confidences)
+        return (0.85 * np.searchsorted(confidences, scores, side="right") / len(confidences)).tolist()
     else:
-        return float(confidence)
+        return scores.astype(float).tolist()
 
 
 def get_BOW(sentence):
@@ -141,36 +183,27 @@ def sample_candidates(candidates, choice_num=1, replace=False, softmax_temperatu
     return sampled_candidates.tolist()
 
 
-def inference(utterances_histories, num_ongoing_utt, approximate_confidence_is_enabled=True):
-    context_encoding = encode_context(utterances_histories)
-    scores = context_encoding.dot(response_encodings.T)
-    indices = np.argsort(scores)[::-1][:10]
-    filtered_indices = []
-    for ind in indices:
-        cand = responses[ind]
-        if not [
-            None
-            for f_utter in banned_responses
-            if difflib.SequenceMatcher(None, f_utter.split(), clear_text(cand).split()).ratio() > 0.9
-        ]:
-            filtered_indices.append(ind)
-
+def inference(utterances_histories, indices, top_scores, num_ongoing_utt, approximate_confidence_is_enabled=True):
+    scores = dict(zip(indices, top_scores))
     if is_unanswerable_utters(utterances_histories):
         return "", 0.0
 
+    filtered_indices = [ind for ind in indices if not banned_responses_filter(*get_response_tokens(ind))]
+
     clear_utterances_histories = [clear_text(utt).split() for utt in utterances_histories[::-1][1::2][::-1]]
+    clear_utterances_histories = [(utterance, Counter(utterance)) for utterance in clear_utterances_histories]
 
     for ind in reversed(filtered_indices):
-        cand = clear_text(responses[ind]).split()
+        cand, cand_counter = get_response_tokens(ind)
         raw_cand = responses[ind].lower()
         # hello ban
         hello_flag = any([j in cand[:3] for j in ["hi", "hello"]])
         # banned_words ban
-        banned_words_flag = any([j in cand for j in banned_words])
-        banned_words_for_questions_flag = any([(j in cand and "?" in raw_cand) for j in banned_words_for_questions])
+        banned_words_flag = not banned_words.isdisjoint(cand)
+        banned_words_for_questions_flag = "?" in raw_cand and not banned_words_for_questions.isdisjoint(cand)
 
         # banned_phrases ban
-        banned_phrases_flag = any([j in raw_cand for j in banned_phrases])
+        banned_phrases_flag = banned_phrases_pattern.search(raw_cand) is not None
 
         # ban long words
         long_words_flag = any([len(j) > 30 for j in cand])
@@ -178,16 +211,16 @@ def inference(utterances_histories, num_ongoing_utt, approximate_confidence_is_e
         if hello_flag or banned_words_flag or banned_words_for_questions_flag or banned_phrases_flag or long_words_flag:
             filtered_indices.remove(ind)
             continue
-        for utterance in clear_utterances_histories:
-            if difflib.SequenceMatcher(None, utterance, cand).ratio() > 0.6:
+        for utterance, utterance_counter in clear_utterances_histories:
+            if is_similar(utterance, utterance_counter, cand, cand_counter, 0.6):
                 filtered_indices.remove(ind)
                 break
 
     if len(filtered_indices) > 0:
-        candidates = [
-            (responses[ind], approximate_confidence(scores[ind], approximate_confidence_is_enabled))
-            for ind in filtered_indices
-        ]
+        candidates_confidences = approximate_confidences(
+            [scores[ind] for ind in filtered_indices], approximate_confidence_is_enabled
+        )
+        candidates = [(responses[ind], conf) for ind, conf in zip(filtered_indices, candidates_confidences)]
         try:
             selected_candidates = sample_candidates(
                 candidates, choice_num=NUM_SAMPLE, softmax_temperature=SOFTMAX_TEMPERATURE
@@ -215,7 +248,13 @@ def convert_chitchat_model():
     utterances_histories = request.json["utterances_histories"]
     approximate_confidence_is_enabled = request.json.get("approximate_confidence_is_enabled", True)
     num_ongoing_utt = request.json.get("num_ongoing_utt", [0])
-    response = [inference(hist, num_ongoing_utt[0], approximate_confidence_is_enabled) for hist in utterances_histories]
+    response = []
+    if utterances_histories:
+        indices, scores = find_top_responses(encode_contexts(utterances_histories))
+        response = [
+            inference(hist, hist_indices, hist_scores, num_ongoing_utt[0], approximate_confidence_is_enabled)
+            for hist, hist_indices, hist_scores in zip(utterances_histories, indices, scores)
+        ]
     total_time = time.time() - st_time
     logger.warning(f"convert_reddit exec time: {total_time:.3f}s")
     return jsonify(response)
@@ -0,0 +1,69 @@
+import collections
+import difflib
+import json
+import random
+import unittest
+
+import numpy as np
+
+from utils import clear_text, compile_phrases_pattern, is_similar, SimilarityFilter, top_k_dot_products
+
+
+def random_texts(vocab, num_texts, max_len):
+    return [" ".join(random.choice(vocab) for _ in range(random.randint(0, max_len))) for _ in range(num_texts)]
+
+
+class SimilarityFilterTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(31415)
+        self.banned_responses = [clear_text(utter) for utter in json.load(open("banned_responses.json"))]
+
+    def test_is_similar_matches_sequence_matcher(self):
+        vocab = ["i", "you", "like", "do", "what", "a", "the", "dog", "cat", "movies"]
+        texts = random_texts(vocab, 300, 8)
+        for threshold in [0.6, 0.9]:
+            for text1 in texts[:60]:
+                for text2 in texts:
+                    tokens1, tokens2 = text1.split(), text2.split()
+                    expected = difflib.SequenceMatcher(None, tokens1, tokens2).ratio() > threshold
+                    counter1, counter2 = collections.Counter(tokens1), collections.Counter(tokens2)
+                    self.assertEqual(expected, is_similar(tokens1, counter1, tokens2, counter2, threshold))
+
+    def test_banned_responses_filter(self):
+        banned_responses_filter = SimilarityFilter(self.banned_responses, threshold=0.9)
+        vocab = sorted({token for utter in self.banned_responses for token in utter.split()})
+        candidates = self.banned_responses + random_texts(vocab, 300, 12) + [""]
+        candidates += [utter + " " + random.choice(vocab) for utter in self.banned_responses]
+        for cand in candidates:
+            expected = any(
+                difflib.SequenceMatcher(None, f_utter.split(), cand.split()).ratio() > 0.9
+                for f_utter in self.banned_responses
+            )
+            self.assertEqual(expected, banned_responses_filter(cand.split()), cand)
+
+    def test_phrases_pattern(self):
+        phrases = json.load(open("banned_phrases.json"))
+        pattern = compile_phrases_pattern(phrases)
+        texts = [f"well, {phrase} is it" for phrase in phrases] + ["hello there", "", "what do you like?"]
+        for text in texts:
+            self.assertEqual(any(phrase in text for phrase in phrases), pattern.search(text) is not None)
+        self.assertIsNone(compile_phrases_pattern([]).search("any text"))
+
+
+class TopKDotProductsTest(unittest.TestCase):
+    def test_matches_full_scores(self):
+        rng = np.random.RandomState(31415)
+        keys = rng.randn(1000, 16).astype(np.float16)
+        queries = rng.randn(5, 16).astype(np.float32)
+        full_scores = queries.dot(keys.astype(np.float32).T)
+        for top_k, chunk_size in [(10, 64), (10, 1000), (10, 7), (3, 2000), (2000, 300)]:
+            indices, scores = top_k_dot_products(queries, keys, top_k, chunk_size)
+            expected_k = min(top_k, len(keys))
+            self.assertEqual(indices.shape, (len(queries), expected_k))
+            np.testing.assert_array_equal(np.take_along_axis(full_scores, indices, axis=1), scores)
+            expected_scores = -np.sort(-full_scores, axis=1)[:, :expected_k]
+            np.testing.assert_array_equal(-np.sort(-scores, axis=1), expected_scores)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,9 @@
+import collections
+import difflib
 import re
 
+import numpy as np
+
 spaces_pat = re.compile(r"\s+")
 special_symb_pat = re.compile(r"[^A-Za-z0-9 ]")
 
@@ -8,3 +12,80 @@ def clear_text(text):
     text = special_symb_pat.sub("", spaces_pat.sub(" ", text.lower().replace("\n", " "))).strip()
     text = text.replace("\u2019", "'")
     return text
+
+
+def is_similar(tokens1, counter1, tokens2, counter2, threshold):
+    """Check that difflib.SequenceMatcher(None, tokens1, tokens2).ratio() > threshold.
+
+    The ratio is 2 * matches / total length, so it is bounded by the lengths of the sequences and by the size
+    of the multiset intersection of their tokens. The sequence matching runs only if both bounds exceed
+    the threshold, so the decisions are the same as of the full comparison.
+    """
+    total_len = len(tokens1) + len(tokens2)
+    if total_len == 0:
+        # SequenceMatcher considers two empty sequences equal
+        return 1.0 > threshold
+    if 2.0 * min(len(tokens1), len(tokens2)) / total_len <= threshold:
+        return False
+    if 2.0 * sum((counter1 & counter2).values()) / total_len <= threshold:
+        return False
+    return difflib.SequenceMatcher(None, tokens1, tokens2).ratio() > threshold
+
+
+class SimilarityFilter:
+    """Finds texts similar to any of the filter texts. The token counts of the filter texts are computed once
+    and the texts are grouped by length, so that the groups of too short or too long texts are skipped at once.
+    """
+
+    def __init__(self, texts, threshold):
+        self.threshold = threshold
+        self.texts_by_len = collections.defaultdict(list)
+        for text in texts:
+            tokens = text.split()
+            self.texts_by_len[len(tokens)].append((tokens, collections.Counter(tokens)))
+
+    def __call__(self, tokens, counter=None):
+        counter = collections.Counter(tokens) if counter is None else counter
+        for text_len, texts in self.texts_by_len.items():
+            total_len = text_len + len(tokens)
+            if total_len and 2.0 * min(text_len, len(tokens)) / total_len <= self.threshold:
+                continue
+            for text_tokens, text_counter in texts:
+                if is_similar(text_tokens, text_counter, tokens, counter, self.threshold):
+                    return True
+        return False
+
+
+def compile_phrases_pattern(phrases):
+    """Compile phrases into one regular expression to find any of them with a single search."""
+    if not phrases:
+        # the empty alternation would match any text
+        return re.compile(r"(?!)")
+    return re.compile("|".join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True)))
+
+
+def top_k_dot_products(queries, keys, top_k, chunk_size=65536):
+    """Find indices of the keys with the highest dot products for every query and the products.
+
+    Keys (e.g. a float16 memory-mapped array) are converted to float32 and scored by chunks of `chunk_size` rows,
+    so that only one chunk is copied at a time. Both returned arrays have shape (number of queries, top_k),
+    the indices are not sorted.
+    """
+    top_k = min(top_k, len(keys))
+    best_indices = np.zeros((len(queries), 0), dtype=np.int64)
+    best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(keys), chunk_size):
+        chunk = np.asarray(keys[start : start + chunk_size], dtype=np.float32)
+        chunk_scores = queries.dot(chunk.T)
+        chunk_top_k = min(top_k, chunk_scores.shape[1])
+        chunk_indices = np.argpartition(-chunk_scores, chunk_top_k - 1, axis=1)[:, :chunk_top_k]
+        candidate_scores = np.concatenate(
+            [best_scores, np.take_along_axis(chunk_scores, chunk_indices, axis=1)], axis=1
+        )
+        candidate_indices = np.concatenate([best_indices, chunk_indices + start], axis=1)
+        if candidate_scores.shape[1] > top_k:
+            selected = np.argpartition(-candidate_scores, top_k - 1, axis=1)[:, :top_k]
+            candidate_scores = np.take_along_axis(candidate_scores, selected, axis=1)
+            candidate_indices = np.take_along_axis(candidate_indices, selected, axis=1)
+        best_scores, best_indices = candidate_scores, candidate_indices
+    return best_indices, best_scores
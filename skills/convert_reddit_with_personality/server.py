@@ -41,7 +41,8 @@ sess = tf.InteractiveSession(graph=tf.Graph())
 
 module = tfhub.Module(MODEL_PATH)
 response_encodings, responses = pickle.load(open(DATABASE_PATH, "rb"))
-confidences = np.load(CONFIDENCE_PATH)
+# calibration confidences are sorted to find the quantile of a score with a binary search
+confidences = np.sort(np.load(CONFIDENCE_PATH))
 filter = json.load(open("./banned_responses.json"))
 
 text_placeholder = tf.placeholder(dtype=tf.string, shape=[None])
@@ -78,7 +79,7 @@ def encode_context(dialogue_history):
 
 
 def approximate_confidence(confidence):
-    return (confidences <= confidence).sum() / len(confidences)
+    return np.searchsorted(confidences, confidence, side="right") / len(confidences)
     # return float(confidence)
 
 
@@ -101,4 +101,4 @@ for task in tqdm.tqdm(data["tasks"]):
         for hyp in res:
             confidences.append(hyp[1])
 
-np.save(str(args.npy_file_path), confidences)
+np.save(str(args.npy_file_path), np.sort(confidences))
@@ -57,7 +57,8 @@ dataset = {topic: pickle.load(open(DATABASE_PATH.replace("*", topic), "rb")) for
 np_load_old = np.load
 
 if pathlib.Path(CONFIDENCE_PATH).is_file():
-    confidences = np.load(CONFIDENCE_PATH, allow_pickle=True)
+    # calibration confidences are sorted to find the quantile of a score with a binary search
+    confidences = np.sort(np.load(CONFIDENCE_PATH, allow_pickle=True))
 else:
     confidences = None
 filter = json.load(open("./banned_responses.json"))
@@ -74,30 +75,27 @@ sess.run(tf.tables_initializer())
 sess.run(tf.global_variables_initializer())
 
 
-def encode_context(dialogue_history):
-    """Encode the dialogue context to the response ranking vector space.
+def encode_contexts(dialogue_histories):
+    """Encode the dialogue contexts to the response ranking vector space in one session run.
 
     Args:
-        dialogue_history: a list of strings, the dialogue history, in
-            chronological order.
+        dialogue_histories: a list of dialogue histories, each of them is a list of strings
+            in chronological order.
     """
 
     # The context is the most recent message in the history.
-    context = dialogue_history[-1]
-
-    extra_context = list(dialogue_history[:-1])
-    extra_context.reverse()
-    extra_context_feature = " ".join(extra_context)
+    contexts = [dialogue_history[-1] for dialogue_history in dialogue_histories]
+    extra_context_features = [" ".join(reversed(dialogue_history[:-1])) for dialogue_history in dialogue_histories]
 
     return sess.run(
         context_encoding_tensor,
-        feed_dict={text_placeholder: [context], extra_text_placeholder: [extra_context_feature]},
-    )[0]
+        feed_dict={text_placeholder: contexts, extra_text_placeholder: extra_context_features},
+    )
 
 
 def approximate_confidence(confidence, approximate_confidence_is_enabled=True):
     if approximate_confidence_is_enabled:
-        return 0.95 * ((confidences <= confidence).sum() / len(confidences))
+        return 0.95 * (np.searchsorted(confidences, confidence, side="right") / len(confidences))
     else:
         return float(confidence)
 
@@ -231,11 +229,10 @@ def select_topics(agent_dialogacts, agent_topics):
     return topics
 
 
-def inference(utterances_histories, topic, approximate_confidence_is_enabled=True):
+def inference(utterances_histories, context_encoding, topic, approximate_confidence_is_enabled=True):
     if not (topic in dataset):
         return "", 0.0, {"topic": topic}
     response_encodings, responses = dataset[topic]
-    context_encoding = encode_context(utterances_histories)
     scores = context_encoding.dot(response_encodings.T)
     indices = np.argsort(scores)[::-1][:10]
     filtered_indices = [ind for ind in indices if responses[ind] not in filter]
@@ -265,9 +262,11 @@ def inference(utterances_histories, topic, approximate_confidence_is_enabled=Tru
         return "", 0.0, {"topic": topic}
 
 
-def choose_best_answer(utterances_histories, topics, approximate_confidence_is_enabled=True):
+def choose_best_answer(utterances_histories, context_encoding, topics, approximate_confidence_is_enabled=True):
     logger.warning(f"topics {topics}")
-    answers = [inference(utterances_histories, topic, approximate_confidence_is_enabled) for topic in topics]
+    answers = [
+        inference(utterances_histories, context_encoding, topic, approximate_confidence_is_enabled) for topic in topics
+    ]
     logger.warning(f"answers {answers}")
     if approximate_confidence_is_enabled:
         return sorted(answers, key=lambda x: -x[1])[0] if answers else ("", 0.0)
@@ -291,9 +290,12 @@ def convert_chitchat_model():
     # logger.warning(f"utterances_histories {utterances_histories}")
     # logger.warning(f"act_topic_batch {act_topic_batch}")
     # logger.warning(f"topic_batch {topic_batch}")
+    context_encodings = encode_contexts(utterances_histories) if utterances_histories else []
     response = [
-        choose_best_answer(hist, select_topics(act_topic, topics), approximate_confidence_is_enabled)
-        for hist, act_topic, topics in zip(utterances_histories, act_topic_batch, topic_batch)
+        choose_best_answer(hist, context_encoding, select_topics(act_topic, topics), approximate_confidence_is_enabled)
+        for hist, context_encoding, act_topic, topics in zip(
+            utterances_histories, context_encodings, act_topic_batch, topic_batch
+        )
     ]
     total_time = time.time() - st_time
     logger.warning(f"response {response}")
@@ -0,0 +1,148 @@
+"""Micro-benchmark of get_last_n_turns on long dialogs against the previous deepcopy-based implementation.
+
+Run from the repository root: python -m state_formatters.benchmark
+"""
+import argparse
+import random
+import string
+import time
+from copy import deepcopy
+
+from state_formatters.utils import (
+    LAST_N_TURNS,
+    get_last_n_turns,
+    is_bot_uttr_repeated_or_misheard,
+    is_human_uttr_repeat_request_or_misheard,
+    remove_clarification_turns_from_dialog,
+    replace_with_annotated_utterances,
+)
+
+
+def split_utterances_deepcopy(new_dialog):
+    new_dialog["human_utterances"] = []
+    new_dialog["bot_utterances"] = []
+    for utt in new_dialog["utterances"]:
+        if utt["user"]["user_type"] == "human":
+            new_dialog["human_utterances"].append(deepcopy(utt))
+        elif utt["user"]["user_type"] == "bot":
+            new_dialog["bot_utterances"].append(deepcopy(utt))
+    return new_dialog
+
+
+def deepcopy_get_last_n_turns(dialog, bot_last_turns=None, total_last_turns=None, excluded_attributes=["entities"]):
+    bot_last_turns = bot_last_turns or LAST_N_TURNS
+    total_last_turns = total_last_turns or bot_last_turns * 2 + 1
+    for utterance in dialog["utterances"][-total_last_turns:]:
+        if "#repeat" in utterance["text"]:
+            total_last_turns += 2
+    new_dialog = {}
+    for key, value in dialog.items():
+        if key not in ["utterances", "human_utterances", "bot_utterances"]:
+            if isinstance(value, dict) and "attributes" in value:
+                new_dialog[key] = {k: deepcopy(v) for k, v in value.items() if k != "attributes"}
+                new_dialog[key]["attributes"] = {
+                    k: deepcopy(v) for k, v in value["attributes"].items() if k not in excluded_attributes
+                }
+            else:
+                new_dialog[key] = deepcopy(value)
+    new_dialog["utterances"] = deepcopy(dialog["utterances"][-total_last_turns:])
+    return split_utterances_deepcopy(new_dialog)
+
+
+def deepcopy_remove_clarification_turns_from_dialog(dialog):
+    new_dialog = deepcopy(dialog)
+    new_dialog["utterances"] = []
+    for i, utt in enumerate(dialog["utterances"]):
+        if utt["user"]["user_type"] == "human":
+            new_dialog["utterances"].append(utt)
+        elif utt["user"]["user_type"] == "bot":
+            if (
+                0 < i < len(dialog["utterances"]) - 1
+                and is_bot_uttr_repeated_or_misheard(utt)
+                and is_human_uttr_repeat_request_or_misheard(dialog["utterances"][i - 1])
+            ):
+                new_dialog["utterances"] = new_dialog["utterances"][:-1]
+            else:
+                new_dialog["utterances"].append(utt)
+    return split_utterances_deepcopy(new_dialog)
+
+
+def random_text(num_words):
+    return " ".join("".join(random.choices(string.ascii_lowercase, k=random.randint(2, 8))) for _ in range(num_words))
+
+
+def make_utterance(user_type, num_annotations):
+    text = random_text(12)
+    annotations = {
+        f"annotator_{i}": {random_text(1): random.random() for _ in range(10)} for i in range(num_annotations)
+    }
+    annotations["sentseg"] = {"punct_sent": text + ".", "segments": [text + "."]}
+    utterance = {
+        "text": text,
+        "user": {"user_type": user_type, "attributes": {"key": random_text(3)}},
+        "annotations": annotations,
+    }
+    if user_type == "human":
+        utterance["hypotheses"] = [
+            {"text": random_text(12), "confidence": random.random(), "skill_name": f"skill_{i}"} for i in range(15)
+        ]
+    else:
+        utterance["active_skill"] = "skill_0"
+    return utterance
+
+
+def make_dialog(num_turns, num_annotations):
+    utterances = []
+    for _ in range(num_turns):
+        utterances += [make_utterance("human", num_annotations), make_utterance("bot", num_annotations)]
+    utterances = utterances[:-1]
+    attributes = {"entities": {random_text(1): {"mentions": random_text(20)} for _ in range(200)}}
+    attributes.update({f"skill_{i}_state": {"history": [random_text(5) for _ in range(50)]} for i in range(30)})
+    return {
+        "utterances": utterances,
+        "human_utterances": [utt for utt in utterances if utt["user"]["user_type"] == "human"],
+        "bot_utterances": [utt for utt in utterances if utt["user"]["user_type"] == "bot"],
+        "human": {"attributes": attributes},
+        "bot": {"attributes": {"persona": [random_text(8) for _ in range(5)]}},
+    }
+
+
+def deepcopy_formatter(dialog):
+    # the most common pattern of the formatters in dp_formatters
+    dialog = deepcopy_get_last_n_turns(dialog)
+    dialog = deepcopy_remove_clarification_turns_from_dialog(dialog)
+    return replace_with_annotated_utterances(dialog, mode="punct_sent")
+
+
+def formatter(dialog):
+    dialog = get_last_n_turns(dialog)
+    dialog = remove_clarification_turns_from_dialog(dialog)
+    return replace_with_annotated_utterances(dialog, mode="punct_sent")
+
+
+def measure(fn, dialog, num_calls):
+    start_time = time.perf_counter()
+    for _ in range(num_calls):
+        fn(dialog)
+    return (time.perf_counter() - start_time) / num_calls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_turns", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--num_annotations", type=int, default=20)
+    parser.add_argument("--num_calls", type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(42)
+    for num_turns in args.num_turns:
+        dialog = make_dialog(num_turns, args.num_annotations)
+        dialog_before = deepcopy(dialog)
+        assert deepcopy_formatter(dialog) == formatter(dialog), "the dialogs made by the implementations differ"
+        old_time = measure(deepcopy_formatter, dialog, args.num_calls)
+        new_time = measure(formatter, dialog, args.num_calls)
+        assert dialog == dialog_before, "the dialog state is mutated"
+        print(
+            f"{num_turns:4d} turns: deepcopy {old_time * 1000:8.3f} ms, "
+            f"shared {new_time * 1000:8.3f} ms, speedup {old_time / new_time:6.1f}x"
+        )
@@ -1,3 +1,4 @@
+import inspect
 import logging
 from copy import deepcopy
 from typing import Dict, List
@@ -908,3 +909,9 @@ def midas_predictor_formatter(dialog: Dict):
     midas_dist = dialog["human_utterances"][-1].get("annotations", {}).get("midas_classification", [{}])[-1]
 
     return [{"last_midas_labels": [max(midas_dist, key=midas_dist.get)], "return_probas": 1}]
+
+
+if utils.DEBUG:
+    for _name, _formatter in list(globals().items()):
+        if inspect.isfunction(_formatter) and _formatter.__module__ == __name__:
+            globals()[_name] = utils.check_dialog_not_mutated(_formatter)
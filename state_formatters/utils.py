@@ -1,5 +1,7 @@
 from typing import Dict, List
+import functools
 import logging
+import os
 from copy import deepcopy
 import re
 
@@ -9,6 +11,8 @@ from common.grounding import BUT_PHRASE, REPEAT_PHRASE
 
 logger = logging.getLogger(__name__)
 LAST_N_TURNS = 5  # number of turns to consider in annotator/skill.
+# check that formatters do not mutate the dialog state, which the dialogs made by get_last_n_turns share objects with
+DEBUG = int(os.getenv("STATE_FORMATTERS_DEBUG", "0"))
 
 
 spaces_pat = re.compile(r"\s+")
@@ -19,6 +23,56 @@ def clean_text(text):
     return special_symb_pat.sub(" ", spaces_pat.sub(" ", text.lower().replace("\n", " "))).strip()
 
 
+def check_dialog_not_mutated(formatter):
+    """Makes the formatter raise an error in debug mode if it mutates the dialog state passed to it."""
+    if not DEBUG:
+        return formatter
+
+    @functools.wraps(formatter)
+    def wrapper(dialog, *args, **kwargs):
+        dialog_before = deepcopy(dialog)
+        result = formatter(dialog, *args, **kwargs)
+        if dialog != dialog_before:
+            raise AssertionError(f"{formatter.__name__} mutated the dialog state")
+        return result
+
+    return wrapper
+
+
+def copy_utterance(utterance: Dict) -> Dict:
+    # formatters only replace the top-level fields of utterances, so the nested objects are shared
+    return dict(utterance)
+
+
+def copy_dialog_fields(dialog: Dict, excluded_attributes=()) -> Dict:
+    """Copies the dialog fields except utterances, the nested objects are shared with the original dialog."""
+    new_dialog = {}
+    for key, value in dialog.items():
+        if key not in ["utterances", "human_utterances", "bot_utterances"]:
+            if isinstance(value, dict) and "attributes" in value:
+                new_dialog[key] = {k: v for k, v in value.items() if k != "attributes"}
+                new_dialog[key]["attributes"] = {
+                    k: v for k, v in value["attributes"].items() if k not in excluded_attributes
+                }
+            elif isinstance(value, dict):
+                new_dialog[key] = dict(value)
+            else:
+                new_dialog[key] = value
+    return new_dialog
+
+
+def split_utterances_by_user(new_dialog: Dict) -> Dict:
+    new_dialog["human_utterances"] = []
+    new_dialog["bot_utterances"] = []
+
+    for utt in new_dialog["utterances"]:
+        if utt["user"]["user_type"] == "human":
+            new_dialog["human_utterances"].append(copy_utterance(utt))
+        elif utt["user"]["user_type"] == "bot":
+            new_dialog["bot_utterances"].append(copy_utterance(utt))
+    return new_dialog
+
+
 def get_last_n_turns(
     dialog: Dict,
     bot_last_turns=None,
@@ -26,6 +80,12 @@ def get_last_n_turns(
     total_last_turns=None,
     excluded_attributes=["entities"],
 ):
+    """Returns the dialog with the last turns only.
+
+    The dialog is not deep-copied: the returned dialog and its utterances are new dicts,
+    but the nested objects (annotations, hypotheses, attribute values) are shared with the original dialog
+    and must not be mutated, see `check_dialog_not_mutated`.
+    """
     bot_last_turns = bot_last_turns or LAST_N_TURNS
     human_last_turns = human_last_turns or bot_last_turns + 1
     total_last_turns = total_last_turns or bot_last_turns * 2 + 1
@@ -35,28 +95,9 @@ def get_last_n_turns(
             human_last_turns += 1
             bot_last_turns += 1
             total_last_turns += 2
-    new_dialog = {}
-    for key, value in dialog.items():
-        if key not in ["utterances", "human_utterances", "bot_utterances"]:
-            if isinstance(value, dict) and "attributes" in value:
-                new_dialog[key] = {k: deepcopy(v) for k, v in value.items() if k != "attributes"}
-                new_dialog[key]["attributes"] = {
-                    k: deepcopy(v) for k, v in value["attributes"].items() if k not in excluded_attributes
-                }
-            else:
-                new_dialog[key] = deepcopy(value)
-    new_dialog["utterances"] = deepcopy(dialog["utterances"][-total_last_turns:])
-
-    new_dialog["human_utterances"] = []
-    new_dialog["bot_utterances"] = []
-
-    for utt in new_dialog["utterances"]:
-        if utt["user"]["user_type"] == "human":
-            new_dialog["human_utterances"].append(deepcopy(utt))
-        elif utt["user"]["user_type"] == "bot":
-            new_dialog["bot_utterances"].append(deepcopy(utt))
-
-    return new_dialog
+    new_dialog = copy_dialog_fields(dialog, excluded_attributes)
+    new_dialog["utterances"] = [copy_utterance(utt) for utt in dialog["utterances"][-total_last_turns:]]
+    return split_utterances_by_user(new_dialog)
 
 
 def is_human_uttr_repeat_request_or_misheard(utt):
@@ -81,13 +122,13 @@ def is_bot_uttr_repeated_or_misheard(utt):
 
 
 def remove_clarification_turns_from_dialog(dialog):
-    new_dialog = deepcopy(dialog)
+    new_dialog = copy_dialog_fields(dialog)
     new_dialog["utterances"] = []
     dialog_length = len(dialog["utterances"])
 
     for i, utt in enumerate(dialog["utterances"]):
         if utt["user"]["user_type"] == "human":
-            new_dialog["utterances"].append(utt)
+            new_dialog["utterances"].append(copy_utterance(utt))
         elif utt["user"]["user_type"] == "bot":
             if (
                 0 < i < dialog_length - 1
@@ -96,18 +137,9 @@ def remove_clarification_turns_from_dialog(dialog):
             ):
                 new_dialog["utterances"] = new_dialog["utterances"][:-1]
             else:
-                new_dialog["utterances"].append(utt)
-
-    new_dialog["human_utterances"] = []
-    new_dialog["bot_utterances"] = []
-
-    for utt in new_dialog["utterances"]:
-        if utt["user"]["user_type"] == "human":
-            new_dialog["human_utterances"].append(deepcopy(utt))
-        elif utt["user"]["user_type"] == "bot":
-            new_dialog["bot_utterances"].append(deepcopy(utt))
+                new_dialog["utterances"].append(copy_utterance(utt))
 
-    return new_dialog
+    return split_utterances_by_user(new_dialog)
 
 
 def replace_with_annotated_utterances(dialog, mode="punct_sent"):
@@ -0,0 +1,84 @@
+import asyncio
+import importlib
+import json
+import unittest
+from unittest import mock
+
+import core.http_client as http_client
+
+
+class FakeResponse:
+    def __init__(self, response):
+        self.response = response
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def json(self):
+        return self.response
+
+
+class FakeSession:
+    """Records the posted payloads and answers with one response per sentence."""
+
+    def __init__(self):
+        self.posted = []
+
+    def post(self, url, json):
+        self.posted.append(json)
+        return FakeResponse([f"{sentence}." for sentence in json["sentences"]])
+
+
+class TestAdaptiveBatching(unittest.TestCase):
+    def test_config_flag_picks_adaptive_batchifyer(self):
+        session, queue = FakeSession(), None
+        config = {"batch_size": 8, "adaptive_batching": True, "max_wait_ms": 5}
+        batchifyer = http_client.make_queue_batchifyer(session, "http://sentseg", queue, config)
+        self.assertIsInstance(batchifyer, http_client.AdaptiveQueueListenerBatchifyer)
+        self.assertEqual(batchifyer.max_wait, 0.005)
+
+        batchifyer = http_client.make_queue_batchifyer(session, "http://sentseg", queue, {"batch_size": 8})
+        self.assertNotIsInstance(batchifyer, http_client.AdaptiveQueueListenerBatchifyer)
+
+    def test_pipeline_connector_sends_adaptive_batches(self):
+        with open("assistant_dists/dream/pipeline_conf.json") as f:
+            connector_config = json.load(f)["connectors"]["sentseg"]
+        self.assertEqual(connector_config["protocol"], "python")
+        # the agent imports "module:Class" connectors and builds them from the config fields
+        module_name, class_name = connector_config["class_name"].split(":")
+        connector_class = getattr(importlib.import_module(module_name), class_name)
+        connector_kwargs = {k: v for k, v in connector_config.items() if k not in ["protocol", "class_name"]}
+        connector = connector_class(**connector_kwargs)
+        session = FakeSession()
+
+        async def run():
+            responses = {}
+            done = asyncio.Event()
+
+            async def callback(task_id, response):
+                responses[task_id] = response
+                if len(responses) == 3:
+                    done.set()
+
+            with mock.patch.object(http_client, "get_client_session", return_value=session):
+                for task_id in range(3):
+                    await connector.send({"task_id": task_id, "payload": {"sentences": [f"hi {task_id}"]}}, callback)
+                await asyncio.wait_for(done.wait(), 1)
+            for task in connector.worker_tasks:
+                task.cancel()
+            return responses
+
+        responses = asyncio.run(run())
+        self.assertTrue(all(isinstance(w, http_client.AdaptiveQueueListenerBatchifyer) for w in connector.workers))
+        self.assertEqual(session.posted, [{"sentences": ["hi 0", "hi 1", "hi 2"]}])
+        self.assertEqual(responses, {0: "hi 0.", 1: "hi 1.", 2: "hi 2."})
+
+
+if __name__ == "__main__":
+    unittest.main()